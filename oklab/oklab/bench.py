@@ -0,0 +1,274 @@
+"""
+Benchmarks of Oklab conversion and data generation.
+
+Cases:
+- Every public function of `conversion` for several numbers of colors. Inputs
+  are produced from random 24-bit colors.
+- Every stage of `generate.main()`: cusps, colors outside of triangle, and
+  Monte Carlo estimation of triangle share outside of sRGB gamut.
+
+For each case there is a minimum time over several runs and peak memory
+allocated during a separate run (tracked with `tracemalloc`, which also tracks
+NumPy allocations). Results can be saved as baseline and later compared with
+it: benchmarking fails if time or peak memory of some case exceeds baseline by
+more than allowed relative tolerance plus absolute noise floor of the metric.
+
+Timing is made robust to noise of shared machines:
+- Runs of cases are interleaved, so short slowdowns spread over cases.
+- Every group of cases is timed together with fixed reference NumPy workload.
+  Times are compared after scaling by ratio of reference times, which cancels
+  out changes of overall machine speed between runs.
+- Noise floor keeps timer jitter of microsecond cases and small allocation
+  differences from failing the comparison.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+
+from oklab import conversion, generate
+
+DEFAULT_SIZES = (1, 1_000, 1_000_000, 2**24)
+
+
+def make_conversion_inputs(size, seed=20230320):
+    rng = np.random.Generator(np.random.PCG64(seed=seed))
+    x = rng.integers(0, 2**24, size=size, dtype=np.uint32)
+    rgb = conversion.int2rgb(x)
+    return {
+        "int": x,
+        "hex": conversion.int2hex(x),
+        "rgb": rgb,
+        "linrgb": conversion.rgb2linrgb(rgb),
+        "oklab": conversion.rgb2oklab(rgb),
+        "oklch": conversion.rgb2oklch(rgb),
+        "oklab_100": conversion.hex2oklab(conversion.int2hex(x)),
+        "oklch_100": conversion.hex2oklch(conversion.int2hex(x)),
+        "lightness": 100 * rgb[0],
+    }
+
+
+# Public conversion functions with names of their inputs
+conversion_cases = {
+    "hex2oklch": "hex",
+    "oklch2hex": "oklch_100",
+    "hex2oklab": "hex",
+    "oklab2hex": "oklab_100",
+    "hex2rgb": "hex",
+    "rgb2hex": "rgb",
+    "hex2int": "hex",
+    "int2hex": "int",
+    "int2rgb": "int",
+    "rgb2int": "rgb",
+    "rgb2oklab": "rgb",
+    "oklab2rgb": "oklab",
+    "rgb2linrgb": "rgb",
+    "linrgb2rgb": "linrgb",
+    "rgb2oklch": "rgb",
+    "oklch2rgb": "oklch",
+    "correct_lightness": "lightness",
+    "correct_lightness_inv": "lightness",
+}
+
+
+def iterate_cases(sizes=DEFAULT_SIZES, pattern=None):
+    # Yield groups of cases as dictionaries with case names as keys and
+    # functions without arguments to benchmark as values. Inputs are created
+    # only for cases with names matching `pattern` and only for one group at a
+    # time (group contains all conversion cases of one size).
+    def is_matching(name):
+        return pattern is None or re.search(pattern, name) is not None
+
+    for size in sizes:
+        names = [n for n in conversion_cases if is_matching(f"conversion.{n}[{size}]")]
+        if len(names) == 0:
+            continue
+        inputs = make_conversion_inputs(size)
+        group = {}
+        for name in names:
+            fun, x = getattr(conversion, name), inputs[conversion_cases[name]]
+            group[f"conversion.{name}[{size}]"] = lambda fun=fun, x=x: fun(x)
+        yield group
+        del inputs, group
+
+    # Stages of data generation are benchmarked on their regular input
+    names = ["generate.cusps", "generate.outside_triangle", "generate.monte_carlo"]
+    if not any(is_matching(name) for name in names):
+        return
+
+    chunks = generate.map_color_chunks
+    find_max_chroma = generate.find_max_chroma_colors
+    compute_outside = generate.compute_chunk_colors_outside_triangle
+    cusps = generate.compute_cusp_data(chunks(find_max_chroma))
+    stages = {
+        "generate.cusps": lambda: generate.compute_cusp_data(chunks(find_max_chroma)),
+        "generate.outside_triangle": lambda: generate.merge_colors_outside_triangle(
+            chunks(compute_outside, cusps)
+        ),
+        "generate.monte_carlo": lambda: (
+            generate.compute_triangle_share_outside_rgb_gamut(cusps)
+        ),
+    }
+    yield {name: fun for name, fun in stages.items() if is_matching(name)}
+
+
+def measure_times(funs, repeat=10, max_time=10):
+    # Minimum time per call of every function. Fast functions are called in
+    # loops long enough to be measured reliably, slow ones are repeated less
+    # within `max_time`. Repeats are done in rounds (one run of every function
+    # per round), so that temporary slowdowns of machine affect single runs of
+    # different functions instead of all runs of one function.
+    timers = {name: timeit.Timer(fun) for name, fun in funs.items()}
+    n_loops, times, spent = {}, {}, {}
+    for name, timer in timers.items():
+        n_loops[name], total_time = timer.autorange()
+        times[name], spent[name] = [total_time / n_loops[name]], total_time
+    for _ in range(repeat - 1):
+        for name, timer in timers.items():
+            if spent[name] < max_time:
+                total_time = timer.timeit(n_loops[name])
+                times[name].append(total_time / n_loops[name])
+                spent[name] += total_time
+    return {name: min(t) for name, t in times.items()}
+
+
+# Fixed workload independent of this package to measure speed of machine
+_reference_input = np.random.default_rng(0).random(2**14)
+
+
+def reference_workload():
+    np.sort(_reference_input)
+
+
+def measure_peak_memory(fun):
+    # Peak memory (in bytes) allocated during single call on top of current
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        fun()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak - current
+
+
+def run(sizes=DEFAULT_SIZES, pattern=None):
+    results = {}
+    for group in iterate_cases(sizes, pattern=pattern):
+        times = measure_times({**group, "reference": reference_workload})
+        for name, fun in group.items():
+            res = {
+                "time": times[name],
+                "peak_memory": measure_peak_memory(fun),
+                "reference_time": times["reference"],
+            }
+            time_str = _format_time(res["time"])
+            memory_str = _format_memory(res["peak_memory"])
+            print(f"{name:<40} {time_str:>10} {memory_str:>10}")
+            results[name] = res
+    return results
+
+
+# Absolute increase of metrics which is considered to be noise
+noise_floors = {"time": 50e-6, "peak_memory": 2**16}
+
+
+def compare(results, baseline, tolerance=0.25, noise_floors=noise_floors):
+    # Return list of descriptions of regressions
+    regressions = []
+    for name, res in results.items():
+        if name not in baseline:
+            continue
+        # Rescale time to speed of machine during baseline run
+        speed = 1.0
+        if "reference_time" in res and "reference_time" in baseline[name]:
+            speed = baseline[name]["reference_time"] / res["reference_time"]
+        for metric, format_value in _metric_formats.items():
+            value, base_value = res[metric], baseline[name][metric]
+            if metric == "time":
+                value = speed * value
+            if value > (1 + tolerance) * base_value + noise_floors[metric]:
+                regressions.append(
+                    f"{name}: {metric} {format_value(value)} "
+                    f"vs baseline {format_value(base_value)}"
+                )
+    return regressions
+
+
+def _format_time(x):
+    for unit, scale in [("s", 1), ("ms", 1e-3), ("us", 1e-6)]:
+        if x >= scale:
+            return f"{x / scale:.2f} {unit}"
+    return f"{x / 1e-9:.0f} ns"
+
+
+def _format_memory(x):
+    for unit, scale in [("GiB", 2**30), ("MiB", 2**20), ("KiB", 2**10)]:
+        if x >= scale:
+            return f"{x / scale:.1f} {unit}"
+    return f"{x} B"
+
+
+_metric_formats = {"time": _format_time, "peak_memory": _format_memory}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Oklab code")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        metavar="N",
+        help="Numbers of colors for conversion benchmarks",
+    )
+    parser.add_argument(
+        "--filter", metavar="REGEX", help="Run only cases with matching names"
+    )
+    parser.add_argument("--save", metavar="PATH", help="Save results as baseline")
+    parser.add_argument(
+        "--compare", metavar="PATH", help="Fail if results are worse than baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed relative increase of time and memory compared to baseline",
+    )
+    args = parser.parse_args(argv)
+
+    print(f"{'Case':<40} {'Time':>10} {'Memory':>10}")
+    results = run(sizes=args.sizes, pattern=args.filter)
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.save!r}")
+
+    if args.compare is not None:
+        if not os.path.exists(args.compare):
+            print(
+                f"There is no baseline at {args.compare!r}. "
+                "Create it with `--save` (`make bench-baseline`)."
+            )
+            sys.exit(1)
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, tolerance=args.tolerance)
+        if len(regressions) > 0:
+            print("Regressions compared to baseline:")
+            print("\n".join(f"  {r}" for r in regressions))
+            sys.exit(1)
+        print("No regressions compared to baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,104 +5,229 @@ Notes:
 - Coversions HEX <-> Oklab and HEX <-> Oklch produce coordinates in range [0; 100]
   and can conditionally correct lightness (`True` by default).
 - Coversions sRGB <-> Oklab and sRGB <-> Oklch produce coordinates in range [0; 1].
+- Input is never modified unless it is supplied as `out`. Numeric outputs can
+  be written into preallocated `out` array (which can be the input itself for
+  in-place conversion), otherwise new array of `dtype` (`float64` by default)
+  is allocated. Using `float32` halves memory traffic at the cost of precision.
+  Each conversion does a small fixed number of extra allocations.
+- HEX <-> Oklab and HEX <-> Oklch conversions with `small_fast_path=True` are
+  done in pure Python by `oklab.small` for fewer than `_small_size` colors (with
+  default `lut`, `dtype`, `out`, and `gamut`), as NumPy overhead dominates for
+  them. This is opt-in, because results are not bit-identical: coordinates
+  differ by up to ~1e-11 (HEX output matched on all tested colors). So with it
+  the same color can get slightly different coordinates depending on number of
+  colors in input.
 """
+
+import math
+
 import numpy as np
-from numpy.typing import ArrayLike, NDArray
+from numpy.typing import ArrayLike, DTypeLike, NDArray
+
+from oklab import small
+
+_small_size = 10
 
 
 # HEX <-> Oklch
-def hex2oklch(hex: ArrayLike, correct_l: bool = True) -> NDArray:
-    res = rgb2oklch(hex2rgb(hex))
-    res[0:2, :] = 100 * res[0:2, :]
+# Supply `lut` (see `oklab.lut`) to replace conversion with a table lookup
+def hex2oklch(
+    hex: ArrayLike,
+    correct_l: bool = True,
+    lut: NDArray | None = None,
+    dtype: DTypeLike = None,
+    out: NDArray | None = None,
+    small_fast_path: bool = False,
+) -> NDArray:
+    use_small = small_fast_path and lut is None and dtype is None and out is None
+    small_hex = _as_small_hex(hex) if use_small else None
+    if small_hex is not None:
+        return _from_small_coords(small.hex2oklch(small_hex, correct_l=correct_l))
+
+    if lut is None:
+        rgb = hex2rgb(hex, dtype=dtype, out=out)
+        res = rgb2oklch(rgb, out=rgb)
+    else:
+        res = _prepare_out(lut[hex2int(hex)].T, out=out, dtype=dtype)
+    res[0:2, :] *= 100
     if correct_l:
-        res[0, :] = correct_lightness(res[0, :])
+        correct_lightness(res[0, :], out=res[0, :])
     return res
 
 
-def oklch2hex(oklch: NDArray, correct_l: bool = True) -> NDArray:
+# Use `gamut` to choose gamut mapping method (see `oklab.gamut`)
+def oklch2hex(
+    oklch: NDArray,
+    correct_l: bool = True,
+    gamut: str = "clip",
+    small_fast_path: bool = False,
+) -> NDArray:
+    use_small = small_fast_path and gamut == "clip"
+    small_oklch = _as_small_coords(oklch) if use_small else None
+    if small_oklch is not None:
+        return np.array(small.oklch2hex(small_oklch, correct_l=correct_l), dtype="U7")
+
+    oklch = np.array(oklch, dtype=np.float64)
     if correct_l:
-        oklch[0, :] = correct_lightness_inv(oklch[0, :])
-    oklch[0:2, :] = 0.01 * oklch[0:2, :]
-    return rgb2hex(oklch2rgb(oklch))
+        correct_lightness_inv(oklch[0, :], out=oklch[0, :])
+    oklch[0:2, :] *= 0.01
+    if gamut != "clip":
+        from oklab.gamut import map_oklch
+
+        oklch = map_oklch(oklch, method=gamut)
+    return rgb2hex(oklch2rgb(oklch, out=oklch))
 
 
 # HEX <-> Oklab
-def hex2oklab(hex: ArrayLike, correct_l: bool = True) -> NDArray:
-    res = 100 * rgb2oklab(hex2rgb(hex))
+def hex2oklab(
+    hex: ArrayLike,
+    correct_l: bool = True,
+    dtype: DTypeLike = None,
+    out: NDArray | None = None,
+    small_fast_path: bool = False,
+) -> NDArray:
+    use_small = small_fast_path and dtype is None and out is None
+    small_hex = _as_small_hex(hex) if use_small else None
+    if small_hex is not None:
+        return _from_small_coords(small.hex2oklab(small_hex, correct_l=correct_l))
+
+    rgb = hex2rgb(hex, dtype=dtype, out=out)
+    res = rgb2oklab(rgb, out=rgb)
+    res *= 100
     if correct_l:
-        res[0, :] = correct_lightness(res[0, :])
+        correct_lightness(res[0, :], out=res[0, :])
     return res
 
 
-def oklab2hex(oklab: NDArray, correct_l: bool = True) -> NDArray:
+def oklab2hex(
+    oklab: NDArray,
+    correct_l: bool = True,
+    gamut: str = "clip",
+    small_fast_path: bool = False,
+) -> NDArray:
+    use_small = small_fast_path and gamut == "clip"
+    small_oklab = _as_small_coords(oklab) if use_small else None
+    if small_oklab is not None:
+        return np.array(small.oklab2hex(small_oklab, correct_l=correct_l), dtype="U7")
+
+    oklab = np.array(oklab, dtype=np.float64)
     if correct_l:
-        oklab[0, :] = correct_lightness_inv(oklab[0, :])
-    return rgb2hex(oklab2rgb(0.01 * oklab))
+        correct_lightness_inv(oklab[0, :], out=oklab[0, :])
+    oklab *= 0.01
+    if gamut != "clip":
+        from oklab.gamut import map_oklab
+
+        oklab = map_oklab(oklab, method=gamut)
+    return rgb2hex(oklab2rgb(oklab, out=oklab))
 
 
 # HEX <-> RGB in [0;1]
-def hex2rgb(hex: ArrayLike) -> NDArray:
-    hex = np.atleast_1d(np.array(hex))
-    hex = np.char.replace(hex, "#", "")
-
-    dec = np.array([int(h, base=16) for h in hex])
-    b = dec % 256
-    g = ((dec - b) / 256) % 256
-    r = np.floor(dec / 65536)
-    # Each color stored as column for more natural matrix multiplication
-    return np.array([r / 255, g / 255, b / 255])
+def hex2rgb(
+    hex: ArrayLike, dtype: DTypeLike = None, out: NDArray | None = None
+) -> NDArray:
+    return int2rgb(hex2int(hex), dtype=dtype, out=out)
 
 
 def rgb2hex(rgb: NDArray) -> NDArray:
+    return int2hex(rgb2int(rgb))
+
+
+# Packed 24-bit integer (0xRRGGBB) <-> RGB in [0;1]
+def int2rgb(
+    x: ArrayLike, dtype: DTypeLike = None, out: NDArray | None = None
+) -> NDArray:
+    x = np.asarray(x, dtype=np.uint32)
+    if out is None:
+        out = np.empty((3,) + x.shape, dtype=np.float64 if dtype is None else dtype)
+    # Each color stored as column for more natural matrix multiplication
+    np.divide((x >> 16) & 255, 255, out=out[0, ...])
+    np.divide((x >> 8) & 255, 255, out=out[1, ...])
+    np.divide(x & 255, 255, out=out[2, ...])
+    return out
+
+
+def rgb2int(rgb: NDArray) -> NDArray:
     rgb = np.array(rgb)
     # Use clamp gamut clipping here. Modify `rgb` prior for a better outcome.
-    c = np.clip(np.round(255 * rgb), 0, 255).astype("int")
-
-    return np.apply_along_axis(lambda x: f"#{x[0]:02x}{x[1]:02x}{x[2]:02x}", 0, c)
-
-
-# Conversion matrices
-conversion_matricies: dict = {}
-
-conversion_matricies["linrgb2lms"] = np.array(
-    [
-        [0.4122214708, 0.5363325363, 0.0514459929],
-        [0.2119034982, 0.6806995451, 0.1073969566],
-        [0.0883024619, 0.2817188376, 0.6299787005],
-    ]
-)
-
-conversion_matricies["cbrtlms2oklab"] = np.array(
-    [
-        [+0.2104542553, +0.7936177850, -0.0040720468],
-        [+1.9779984951, -2.4285922050, +0.4505937099],
-        [+0.0259040371, +0.7827717662, -0.8086757660],
-    ]
-)
-
-conversion_matricies["oklab2cbrtlms"] = np.array(
-    [
-        [+1.0, +0.3963377774, +0.2158037573],
-        [+1.0, -0.1055613458, -0.0638541728],
-        [+1.0, -0.0894841775, -1.2914855480],
-    ]
-)
-
-conversion_matricies["lms2linrgb"] = np.array(
-    [
-        [+4.0767416621, -3.3077115913, +0.2309699292],
-        [-1.2684380046, +2.6097574011, -0.3413193965],
-        [-0.0041960863, -0.7034186147, +1.7076147010],
-    ]
-)
+    c = np.clip(np.round(255 * rgb), 0, 255).astype(np.uint32)
+    return (c[0] << 16) | (c[1] << 8) | c[2]
+
+
+# HEX <-> packed 24-bit integer (0xRRGGBB)
+# Both directions work on fixed-width character codes of a whole array at once
+# without any per-element Python calls
+_hex_digits = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+
+_hex_nibbles = np.full(256, 255, dtype=np.uint8)
+_hex_nibbles[np.frombuffer(b"0123456789", dtype=np.uint8)] = np.arange(10)
+_hex_nibbles[np.frombuffer(b"abcdef", dtype=np.uint8)] = np.arange(10, 16)
+_hex_nibbles[np.frombuffer(b"ABCDEF", dtype=np.uint8)] = np.arange(10, 16)
+
+
+# Accepts '#rrggbb', 'rrggbb', '#rgb', and 'rgb' (case insensitive). Returns 1d
+# `uint32` array with one element per input string.
+def hex2int(hex: ArrayLike) -> NDArray:
+    hex = np.atleast_1d(np.asarray(hex))
+    if hex.dtype.kind not in "SU":
+        hex = hex.astype(str)
+    hex = np.ascontiguousarray(hex.reshape(-1))
+
+    # Represent strings as matrix of character codes (one row per string) with
+    # zero padding at the end
+    n, width = hex.shape[0], hex.dtype.itemsize // (4 if hex.dtype.kind == "U" else 1)
+    code_dtype = np.uint32 if hex.dtype.kind == "U" else np.uint8
+    codes = np.zeros((n, max(width, 7)), dtype=code_dtype)
+    if width > 0:
+        codes[:, :width] = hex.view(code_dtype).reshape(n, width)
+
+    has_hash = codes[:, 0] == ord("#")
+    n_digits = np.count_nonzero(codes, axis=1) - has_hash
+    is_short = n_digits == 3
+    if not ((n_digits == 6) | is_short).all():
+        bad = hex[~((n_digits == 6) | is_short)][0]
+        raise ValueError(f"Invalid HEX color: {str(bad)!r}")
+
+    # Gather six digits per string: '#rgb' is expanded as '#rrggbb'
+    digit_inds = np.where(
+        is_short[:, np.newaxis], np.array([0, 0, 1, 1, 2, 2]), np.arange(6)
+    )
+    digit_inds = digit_inds + has_hash[:, np.newaxis]
+    digits = np.take_along_axis(codes, digit_inds, axis=1)
+    nibbles = _hex_nibbles[np.minimum(digits, 255)]
+
+    is_bad = (nibbles == 255).any(axis=1)
+    if is_bad.any():
+        raise ValueError(f"Invalid HEX color: {str(hex[is_bad][0])!r}")
+
+    nibbles = nibbles.astype(np.uint32)
+    shifts = np.array([20, 16, 12, 8, 4, 0], dtype=np.uint32)
+    return np.bitwise_or.reduce(nibbles << shifts, axis=1)
+
+
+# Output has the same shape as input and '<U7' data type
+def int2hex(x: ArrayLike) -> NDArray:
+    x = np.asarray(x, dtype=np.uint32)
+    shifts = np.array([20, 16, 12, 8, 4, 0], dtype=np.uint32)
+
+    # Fill matrix of character codes and reinterpret it as fixed-width strings
+    codes = np.empty(x.shape + (7,), dtype=np.uint32)
+    codes[..., 0] = ord("#")
+    codes[..., 1:] = _hex_digits[(x[..., np.newaxis] >> shifts) & 15]
+    return codes.view("U7")[..., 0]
+
+
+# Conversion matrices (defined in `oklab.small` to be shared with it)
+conversion_matricies = {name: np.array(m) for name, m in small.matrices.items()}
 
 
 # RGB in [0;1] <-> Oklab
-def rgb2oklab(rgb: NDArray) -> NDArray:
-    linrgb = rgb2linrgb(rgb)
-    lms = np.matmul(conversion_matricies["linrgb2lms"], linrgb)
-    cbrtlms = np.cbrt(lms)
-    res = np.matmul(conversion_matricies["cbrtlms2oklab"], cbrtlms)
+def rgb2oklab(
+    rgb: NDArray, dtype: DTypeLike = None, out: NDArray | None = None
+) -> NDArray:
+    res = rgb2linrgb(rgb, dtype=dtype, out=out)
+    lms = np.matmul(_matrix("linrgb2lms", res.dtype), res)
+    cbrtlms = np.cbrt(lms, out=lms)
+    np.matmul(_matrix("cbrtlms2oklab", res.dtype), cbrtlms, out=res)
 
     # Explicitly convert gray colors
     is_gray = (np.abs(res[1:3, :]) < 1e-5).all(axis=0)
@@ -111,58 +236,143 @@ def rgb2oklab(rgb: NDArray) -> NDArray:
     return res
 
 
-def oklab2rgb(oklab: NDArray) -> NDArray:
-    cbrtlms = np.matmul(conversion_matricies["oklab2cbrtlms"], oklab)
-    lms = cbrtlms**3
-    linrgb = np.matmul(conversion_matricies["lms2linrgb"], lms)
-    return linrgb2rgb(linrgb)
-
+def oklab2rgb(
+    oklab: NDArray, dtype: DTypeLike = None, out: NDArray | None = None
+) -> NDArray:
+    res = _prepare_out(oklab, dtype=dtype, out=out)
+    cbrtlms = np.matmul(_matrix("oklab2cbrtlms", res.dtype), res)
+    lms = np.power(cbrtlms, 3, out=cbrtlms)
+    np.matmul(_matrix("lms2linrgb", res.dtype), lms, out=res)
+    return linrgb2rgb(res, out=res)
+
+
+def rgb2linrgb(
+    rgb: NDArray, dtype: DTypeLike = None, out: NDArray | None = None
+) -> NDArray:
+    res = _prepare_out(rgb, dtype=dtype, out=out)
+    np.clip(res, 0, 1, out=res)
+    is_low = res <= 0.04045
+    low = res[is_low] / 12.92
+
+    res += 0.055
+    res /= 1.055
+    np.power(res, 2.4, out=res)
+    res[is_low] = low
+    return res
 
-def rgb2linrgb(rgb: NDArray) -> NDArray:
-    rgb = np.clip(rgb, 0, 1)
-    return np.where(0.04045 < rgb, np.power((rgb + 0.055) / 1.055, 2.4), rgb / 12.92)
 
+def linrgb2rgb(
+    linrgb: NDArray, dtype: DTypeLike = None, out: NDArray | None = None
+) -> NDArray:
+    res = _prepare_out(linrgb, dtype=dtype, out=out)
+    np.clip(res, 0, 1, out=res)
+    is_low = 0.0031308 >= res
+    low = 12.92 * res[is_low]
 
-def linrgb2rgb(linrgb: NDArray) -> NDArray:
-    linrgb = np.clip(linrgb, 0, 1)
-    return np.where(
-        0.0031308 >= linrgb,
-        12.92 * linrgb,
-        1.055 * np.power(linrgb, 0.416666667) - 0.055,
-    )
+    np.power(res, 0.416666667, out=res)
+    res *= 1.055
+    res -= 0.055
+    res[is_low] = low
+    return res
 
 
 # RGB in [0;1] <-> Oklch
-def rgb2oklch(rgb: NDArray) -> NDArray:
-    oklab = rgb2oklab(rgb=rgb)
-    l, a, b = oklab[0, :], oklab[1, :], oklab[2, :]
+def rgb2oklch(
+    rgb: NDArray, dtype: DTypeLike = None, out: NDArray | None = None
+) -> NDArray:
+    res = rgb2oklab(rgb, dtype=dtype, out=out)
+    a, b = res[1, :], res[2, :]
     c = np.sqrt(a**2 + b**2)
-    h = np.arctan2(b, a)
-    return np.array([l, c, np.rad2deg(h) % 360])
+    h = np.arctan2(b, a, out=res[2, :])
+    np.mod(np.rad2deg(h, out=h), 360, out=h)
+    res[1, :] = c
+    return res
 
 
-def oklch2rgb(oklch: NDArray) -> NDArray:
-    l, c, h = oklch[0, :], oklch[1, :], np.deg2rad(oklch[2, :] % 360)
+def oklch2rgb(
+    oklch: NDArray, dtype: DTypeLike = None, out: NDArray | None = None
+) -> NDArray:
+    res = _prepare_out(oklch, dtype=dtype, out=out)
+    c, h = res[1, :], res[2, :]
+    np.deg2rad(np.mod(h, 360, out=h), out=h)
     a = c * np.cos(h)
-    b = c * np.sin(h)
-    return oklab2rgb(np.array([l, a, b]))
+    np.sin(h, out=h)
+    h *= c
+    res[1, :] = a
+    return oklab2rgb(res, out=res)
 
 
 # Source:
 # https://bottosson.github.io/posts/colorpicker/#intermission---a-new-lightness-estimate-for-oklab
 # Assume both input and output in range [0; 100] instead of [0; 1]
-def correct_lightness(x: NDArray) -> NDArray:
+def correct_lightness(x: NDArray, out: NDArray | None = None) -> NDArray:
     x = 0.01 * x
     k_1, k_2 = 0.206, 0.03
     k_3 = (1 + k_1) / (1 + k_2)
 
     res = 0.5 * (k_3 * x - k_1 + np.sqrt((k_3 * x - k_1) ** 2 + 4 * k_2 * k_3 * x))
-    return 100 * res
+    return np.multiply(100, res, out=out)
 
 
-def correct_lightness_inv(x: NDArray) -> NDArray:
+def correct_lightness_inv(x: NDArray, out: NDArray | None = None) -> NDArray:
     x = 0.01 * x
     k_1, k_2 = 0.206, 0.03
     k_3 = (1 + k_1) / (1 + k_2)
     res = x * (x + k_1) / (k_3 * (x + k_2))
-    return 100 * res
+    return np.multiply(100, res, out=out)
+
+
+# Helpers
+def _prepare_out(x: ArrayLike, dtype: DTypeLike = None, out: NDArray | None = None):
+    # Array to compute result in: `out` with copied `x` or a copy of `x`
+    if out is None:
+        return np.array(x, dtype=np.float64 if dtype is None else dtype)
+    if out is not x:
+        np.copyto(out, x, casting="same_kind")
+    return out
+
+
+def _matrix(name: str, dtype: DTypeLike) -> NDArray:
+    mat = conversion_matricies[name]
+    return mat if mat.dtype == dtype else mat.astype(dtype)
+
+
+def _as_small_hex(hex: ArrayLike) -> list | None:
+    # List of HEX strings if `hex` should be converted by `oklab.small`
+    if isinstance(hex, str):
+        return [hex]
+    if isinstance(hex, np.ndarray):
+        if hex.ndim != 1 or hex.dtype.kind != "U" or len(hex) >= _small_size:
+            return None
+        hex = hex.tolist()
+    if not isinstance(hex, (list, tuple)) or not 0 < len(hex) < _small_size:
+        return None
+    return list(hex) if all(isinstance(x, str) for x in hex) else None
+
+
+def _as_small_coords(x: ArrayLike) -> list | None:
+    # List of finite coordinate triples if (3, n) input `x` should be converted
+    # by `oklab.small`
+    if isinstance(x, np.ndarray):
+        if x.shape[:1] != (3,) or x.ndim != 2 or x.dtype.kind not in "iuf":
+            return None
+        if x.shape[1] >= _small_size:
+            return None
+        x = x.tolist()
+    if not isinstance(x, (list, tuple)) or len(x) != 3:
+        return None
+    if not all(isinstance(row, (list, tuple)) for row in x):
+        return None
+    n = len(x[0])
+    if not 0 < n < _small_size or len(x[1]) != n or len(x[2]) != n:
+        return None
+    colors = list(zip(*x))
+    is_finite = all(
+        isinstance(v, (int, float)) and math.isfinite(v) for c in colors for v in c
+    )
+    return colors if is_finite else None
+
+
+def _from_small_coords(colors: list) -> NDArray:
+    # Coordinate triples of `oklab.small` as (3, n) array
+    return np.array(list(zip(*colors)), dtype=np.float64)
@@ -13,39 +13,117 @@ Generate data related to Oklab/Oklch color space:
       (100 - y) * c_cusp = x * (100 - L_cusp)
 """
 
+import argparse
+import contextlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-import pandas as pd
 
-from oklab import conversion
+from oklab import conversion, gamut, lut as oklch_lut
+
+# `pandas` is imported inside functions which create data frames, as it is
+# slow to import and is not needed for conversions and array computations
+
+
+def generate_color_chunks(chunk_size=16, lut=None):
+    # Yield grid of all sRGB colors (scaled to [0;1]) in slabs with `chunk_size`
+    # values of green channel (outer grid axis). This keeps memory usage bounded
+    # while producing rows in the same order as for a whole grid.
+    for start in range(0, 256, chunk_size):
+        yield generate_color_chunk(start, chunk_size=chunk_size, lut=lut)
 
 
-def generate_all_colors():
-    # Create grid of all sRGB colors (scaled to [0;1])
+def generate_color_chunk(start, chunk_size=16, lut=None):
+    import pandas as pd
+
     channel_colors = np.linspace(0, 1, 256)
-    grid = np.array(np.meshgrid(channel_colors, channel_colors, channel_colors))
+    slab_colors = channel_colors[start : start + chunk_size]
+    grid = np.array(np.meshgrid(channel_colors, slab_colors, channel_colors))
     grid = grid.reshape(3, -1)
 
-    # Convert all colors to Oklch with correctled lightness
-    oklch = conversion.rgb2oklch(grid)
+    # Convert colors to Oklch with correctled lightness. Use precomputed lookup
+    # table if supplied.
+    if lut is None:
+        oklch = conversion.rgb2oklch(grid)
+    else:
+        oklch = oklch_lut.rgb2oklch(grid, lut)
     oklch[0:2, :] = 100 * oklch[0:2, :]
 
     colors = pd.DataFrame(
         np.concatenate([grid, oklch]).T, columns=["r", "g", "b", "L", "c", "h"]
     )
-    colors["hue_floor"] = colors.h.apply(np.floor).astype("int")
+    colors["hue_floor"] = np.floor(oklch[2, :]).astype("int")
 
     return colors
 
 
-def compute_cusp_data(colors):
-    # Compute cusps for all integer hues
-    cusps = (
-        colors.sort_values("c", ascending=False)
-        .drop_duplicates("hue_floor")
-        .sort_values("hue_floor")
-        .reset_index(drop=True)
+def map_color_chunks(fun, *args, chunk_size=16, lut_path=None, executor=None):
+    # Yield `fun(colors, *args)` for every chunk of colors in grid order. If
+    # `executor` is supplied, chunks are generated and processed in its workers
+    # and only (supposedly small) results are sent back.
+    if executor is None:
+        lut = _load_lut(lut_path)
+        for colors in generate_color_chunks(chunk_size=chunk_size, lut=lut):
+            yield fun(colors, *args)
+        return
+
+    starts = range(0, 256, chunk_size)
+    n = len(starts)
+    yield from executor.map(
+        _apply_to_color_chunk,
+        itertools.repeat(fun, n),
+        starts,
+        itertools.repeat(chunk_size, n),
+        itertools.repeat(lut_path, n),
+        itertools.repeat(args, n),
     )
 
+
+def _apply_to_color_chunk(fun, start, chunk_size, lut_path, args):
+    # Memory-mapped lookup table is opened in worker instead of being pickled
+    lut = _load_lut(lut_path, build=False)
+    return fun(generate_color_chunk(start, chunk_size=chunk_size, lut=lut), *args)
+
+
+def _load_lut(lut_path, build=True):
+    # Only `float64` table gives exactly the same output as direct conversion
+    if lut_path is None:
+        return None
+    return oklch_lut.load_lut(lut_path, build=build, dtype=np.float64)
+
+
+def generate_all_colors(lut=None):
+    return next(generate_color_chunks(chunk_size=256, lut=lut))
+
+
+def find_max_chroma_colors(colors):
+    # Rows with maximum chroma per integer hue (the first one in case of ties)
+    hue_floor = colors["hue_floor"].to_numpy()
+    c = colors["c"].to_numpy()
+    max_c = np.full(hue_floor.max() + 1, -np.inf)
+    np.maximum.at(max_c, hue_floor, c)
+
+    is_max = np.flatnonzero(c == max_c[hue_floor])
+    _, first_inds = np.unique(hue_floor[is_max], return_index=True)
+    return colors.iloc[is_max[first_inds]]
+
+
+def compute_cusp_data(colors):
+    # Compute cusps for all integer hues. Allow `colors` to be an iterable of
+    # chunks, in which case maxima are reduced incrementally.
+    import pandas as pd
+
+    if isinstance(colors, pd.DataFrame):
+        colors = [colors]
+    cusps = None
+    for chunk in colors:
+        chunk_cusps = find_max_chroma_colors(chunk)
+        if cusps is not None:
+            chunk_cusps = find_max_chroma_colors(pd.concat([cusps, chunk_cusps]))
+        cusps = chunk_cusps
+    cusps = cusps.sort_values("hue_floor").reset_index(drop=True)
+
     # Prepare data for output and return
     cusps_rgb = cusps.loc[:, ["r", "g", "b"]].to_numpy().T
     cusps["hex"] = conversion.rgb2hex(cusps_rgb)
@@ -56,77 +134,121 @@ def compute_cusp_data(colors):
     return cusps.loc[:, ["hue_floor", "hex", "L", "L_r", "c", "h"]]
 
 
+def compare_with_analytic_cusps(cusps):
+    # Differences between brute-force and analytic cusps at the same hue
+    import pandas as pd
+
+    L, c = 100 * gamut.find_cusp(cusps["h"].to_numpy())
+    return pd.DataFrame(
+        {"hue_floor": cusps["hue_floor"], "L": L - cusps["L"], "c": c - cusps["c"]}
+    )
+
+
 def compute_colors_outside_triangle(colors, cusps):
-    cusps_right = cusps.loc[:, ["hue_floor", "L", "c"]].rename(
-        columns={"L": "L_cusp", "c": "c_cusp"}
+    # Allow `colors` to be an iterable of chunks, in which case only rows
+    # outside of triangle are kept between chunks
+    import pandas as pd
+
+    if isinstance(colors, pd.DataFrame):
+        colors = [colors]
+    return merge_colors_outside_triangle(
+        compute_chunk_colors_outside_triangle(chunk, cusps) for chunk in colors
     )
-    c = colors.merge(cusps_right, how="left")
+
+
+def merge_colors_outside_triangle(chunks):
+    import pandas as pd
+
+    outside_triang = pd.concat(list(chunks), ignore_index=True)
+    # Use stable sorting to keep grid order among rows with equal `L_outside`
+    return outside_triang.sort_values("L_outside", ascending=False, kind="stable")
+
+
+def compute_chunk_colors_outside_triangle(colors, cusps):
+    # Attach cusp data by indexing aligned arrays with integer hue, and compute
+    # everything on arrays. Data frame is created only for rows outside of
+    # triangle.
+    import pandas as pd
+
+    cusp_L, cusp_c = get_cusp_arrays(cusps)
+    hue_floor = colors["hue_floor"].to_numpy()
+    L_cusp, c_cusp = cusp_L[hue_floor], cusp_c[hue_floor]
+    L, c = colors["L"].to_numpy(), colors["c"].to_numpy()
 
     # Range of allowed `L` is computed based on its current `c`:
     # - Lower is from segment between (0, 0) and cusp.
     # - Upper is from segment between (0, 100) and cusp.
-    saturation = c["c"] / c["c_cusp"]
-    c["L_lower"] = saturation * c["L_cusp"]
-    c["L_upper"] = saturation * (c["L_cusp"] - 100) + 100
+    saturation = c / c_cusp
+    L_lower = saturation * L_cusp
+    L_upper = saturation * (L_cusp - 100) + 100
+
+    # Compute if outside of triangle. Round prior to computing condition to
+    # avoid very small light differences.
+    L_round = np.round(L, decimals=2)
+    L_lower = np.round(L_lower, decimals=2)
+    L_upper = np.round(L_upper, decimals=2)
+    is_outside = np.flatnonzero((L_round < L_lower) | (L_upper < L_round))
+
+    # Only rows outside of triangle are needed from now on
+    L, L_round = L[is_outside], L_round[is_outside]
+    L_lower, L_upper = L_lower[is_outside], L_upper[is_outside]
+    L_cusp, c_cusp = L_cusp[is_outside], c_cusp[is_outside]
+    c = np.round(c[is_outside], decimals=2)
+    h = colors["h"].to_numpy()[is_outside]
+    rgb = colors.loc[:, ["r", "g", "b"]].to_numpy()[is_outside].T
 
     # Maximum allowed `c` is computed based on its currnet `L` and depends on
     # whether `L` is below or above `L_cusp`:
     # - If below, then it is from lower triangle segment.
     # - If above - from upper segment.
-    c["c_upper"] = np.where(
-        c["L"] <= c["L_cusp"],
-        c["c_cusp"] * c["L"] / c["L_cusp"],
-        c["c_cusp"] * (100 - c["L"]) / (100 - c["L_cusp"]),
+    c_upper = np.where(
+        L <= L_cusp,
+        c_cusp * L / L_cusp,
+        c_cusp * (100 - L) / (100 - L_cusp),
     )
+    L = L_round
 
-    # Compute if outside of triangle. Round prior to computing condition to
-    # avoid very small light differences.
-    c.loc[:, ["L", "L_lower", "L_upper", "c", "c_upper"]] = c.loc[
-        :, ["L", "L_lower", "L_upper", "c", "c_upper"]
-    ].round(decimals=2)
-    is_outside = ((c["L"]) < c["L_lower"]) | (c["L_upper"] < (c["L"]))
-    outside_triang = c.loc[is_outside, :].copy()
-
-    is_below = outside_triang["L"] < outside_triang["L_lower"]
-    l_outside = np.where(
-        is_below,
-        outside_triang["L_lower"] - outside_triang["L"],
-        outside_triang["L"] - outside_triang["L_upper"],
-    )
-    outside_triang["L_outside"] = np.round(l_outside, decimals=2)
+    is_below = L < L_lower
+    L_outside = np.round(np.where(is_below, L_lower - L, L - L_upper), decimals=2)
 
     # Compute the closest hex color from modeled range
     # NOTE: this is not entirely accurate as data is rounded to 2 decimal places
-    l_modeled = np.where(is_below, outside_triang["L_lower"], outside_triang["L_upper"])
-    lch = np.concatenate(
-        [np.atleast_2d(l_modeled), outside_triang.loc[:, ["c", "h"]].to_numpy().T]
-    )
-    outside_triang["hex_modeled"] = conversion.oklch2hex(lch, correct_l=False)
+    l_modeled = np.where(is_below, L_lower, L_upper)
+    hex_modeled = conversion.oklch2hex(np.array([l_modeled, c, h]), correct_l=False)
 
     # Prepare output data and return
-    rgb = outside_triang.loc[:, ["r", "g", "b"]].to_numpy().T
-    outside_triang["hex"] = conversion.rgb2hex(rgb)
-    return outside_triang.loc[
-        :,
-        [
-            "hue_floor",
-            "hex",
-            "hex_modeled",
-            "L",
-            "L_lower",
-            "L_upper",
-            "c",
-            "c_upper",
-            "L_outside",
-        ],
-    ].sort_values("L_outside", ascending=False)
-
-
-def generate_points_inside_triangles(cusps, size=1_000_000, seed=None):
+    return pd.DataFrame(
+        {
+            "hue_floor": hue_floor[is_outside],
+            "hex": conversion.rgb2hex(rgb),
+            "hex_modeled": hex_modeled,
+            "L": L,
+            "L_lower": L_lower,
+            "L_upper": L_upper,
+            "c": c,
+            "c_upper": np.round(c_upper, decimals=2),
+            "L_outside": L_outside,
+        }
+    )
+
+
+def get_cusp_arrays(cusps):
+    # Arrays of cusps' `L` and `c` which can be indexed by integer hue
+    hue_floor = cusps["hue_floor"].to_numpy()
+    cusp_L, cusp_c = np.full(360, np.nan), np.full(360, np.nan)
+    cusp_L[hue_floor] = cusps["L"].to_numpy()
+    cusp_c[hue_floor] = cusps["c"].to_numpy()
+    return cusp_L, cusp_c
+
+
+def generate_points_inside_triangles(cusps, size=1_000_000, seed=None, hue=None):
+    # Use `seed` as in `np.random.default_rng()`, so it can also be a generator
+    # to continue drawing from. Supply `hue` to not draw it from uniform.
     if seed is None:
         seed = 20230320
-    rng = np.random.Generator(np.random.PCG64(seed=seed))
-    hue = rng.uniform(0, 360, size=size)
+    rng = np.random.default_rng(seed)
+    if hue is None:
+        hue = rng.uniform(0, 360, size=size)
 
     # Generate two vectors with elements sum no more than 1
     u = rng.uniform(size=size)
@@ -136,45 +258,191 @@ def generate_points_inside_triangles(cusps, size=1_000_000, seed=None):
     v = np.where(is_sum_more_than_one, 1 - v, v)
 
     # Convert (hue, u, v) to (hue, L, c)
+    cusp_L, cusp_c = get_cusp_arrays(cusps)
     hue_floor = np.floor(hue).astype("int")
-    point_cusps = pd.DataFrame({"hue_floor": hue_floor}).merge(
-        cusps.loc[:, ["hue_floor", "L", "c"]], how="left", on="hue_floor"
-    )
-    c = (u * 0 + v * point_cusps["c"]).to_numpy()
-    L = (u * 100 + v * point_cusps["L"]).to_numpy()
+    c = u * 0 + v * cusp_c[hue_floor]
+    L = u * 100 + v * cusp_L[hue_floor]
 
     return np.array([L, c, hue])
 
 
-def compute_triangle_share_outside_rgb_gamut(cusps, size=1_000_000, seed=None):
-    lch = generate_points_inside_triangles(cusps, size=size, seed=seed)
-    lch[0:2, :] = 0.01 * lch[0:2, :]
-    points_rgb = conversion.oklch2rgb(lch)
-    is_bad_point = ((points_rgb < 0) | (1 < points_rgb)).any(axis=0)
-    return is_bad_point.sum() / size
-
-
-def main():
-    print("Generating all colors")
-    colors = generate_all_colors()
+def is_outside_rgb_gamut(lch):
+    # Check linear RGB before clipping which is done in `conversion.oklch2rgb()`
+    L, c, h = 0.01 * lch[0, :], 0.01 * lch[1, :], np.deg2rad(lch[2, :])
+    return ~gamut.is_in_gamut(np.array([L, c * np.cos(h), c * np.sin(h)]))
 
-    # Cusps
-    print("Computing cusps")
-    cusps = compute_cusp_data(colors)
 
-    print("Saving cusps")
-    cusps.to_csv("cusps.csv", index=False)
-
-    # Colors outside of triangle
-    print("Computing colors outside of triangle")
-    colors_outside_triangle = compute_colors_outside_triangle(colors, cusps)
+def compute_triangle_share_outside_rgb_gamut(
+    cusps, size=1_000_000, seed=None, executor=None, block_size=2**16
+):
+    # Split points into blocks of fixed size with independent random streams
+    # spawned from `seed`. This makes result the same with and without
+    # `executor` and independent of number of its workers.
+    if seed is None:
+        seed = 20230320
+    n_blocks = -(-size // block_size)
+    block_seeds = np.random.SeedSequence(seed).spawn(n_blocks)
+    block_sizes = np.diff(np.minimum(np.arange(n_blocks + 1) * block_size, size))
+    map_fun = map if executor is None else executor.map
+    n_bad = map_fun(
+        count_points_outside_rgb_gamut,
+        itertools.repeat(cusps, n_blocks),
+        block_sizes,
+        block_seeds,
+    )
+    return sum(n_bad) / size
 
-    print("Saving colors outside of triangle")
-    colors_outside_triangle.to_csv("colors_outside_triangle.csv", index=False)
 
-    print("Generating share of triangles outside of RGB")
-    share_outside = compute_triangle_share_outside_rgb_gamut(cusps, size=1_000_000)
-    print(f"  The answer is approximately {100 * share_outside:.2f}")
+def count_points_outside_rgb_gamut(cusps, size=1_000_000, seed=None):
+    lch = generate_points_inside_triangles(cusps, size=size, seed=seed)
+    return is_outside_rgb_gamut(lch).sum()
+
+
+def estimate_triangle_share_outside_rgb_gamut(
+    cusps,
+    target_se=1e-4,
+    batch_size=2**16,
+    max_size=100_000_000,
+    seed=None,
+    stratified=False,
+):
+    # Draw points in batches until standard error of share estimate is not
+    # bigger than `target_se` (or `max_size` points are drawn). This uses
+    # constant memory. Return share, its standard error, and number of points.
+    #
+    # If `stratified`, every batch has equal number of points for each integer
+    # hue, and estimate is an average of per hue shares.
+    if seed is None:
+        seed = 20230320
+    rng = np.random.default_rng(seed)
+    n_strata = 360 if stratified else 1
+    per_stratum = max(batch_size // n_strata, 1)
+    n_bad, n_total = np.zeros(n_strata), np.zeros(n_strata)
+
+    while n_total.sum() < max_size:
+        size = per_stratum * n_strata
+        hue = None
+        if stratified:
+            hue = np.repeat(np.arange(360), per_stratum) + rng.uniform(size=size)
+        lch = generate_points_inside_triangles(cusps, size=size, seed=rng, hue=hue)
+        is_bad = is_outside_rgb_gamut(lch)
+
+        stratum = np.floor(lch[2, :]).astype("int") if stratified else 0
+        n_bad += np.bincount(np.broadcast_to(stratum, size), is_bad, n_strata)
+        n_total += per_stratum
+
+        # Use Agresti-Coull adjustment in standard error to not stop too early
+        # when there are no bad points yet
+        share = np.mean(n_bad / n_total)
+        p_adj = (n_bad + 2) / (n_total + 4)
+        se = np.sqrt(np.sum(p_adj * (1 - p_adj) / (n_total + 4))) / n_strata
+        if se <= target_se:
+            break
+
+    return share, se, int(n_total.sum())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate Oklab/Oklch data")
+    parser.add_argument(
+        "--lut",
+        metavar="PATH",
+        help=(
+            "Path to 'float64' Oklch lookup table to use (built if it doesn't "
+            "exist). Output is the same as without it."
+        ),
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=16,
+        metavar="N",
+        help="Number of green channel values in one processed slab of RGB cube",
+    )
+    parser.add_argument(
+        "--target-se",
+        type=float,
+        metavar="X",
+        help=(
+            "Estimate share of triangles outside of RGB with adaptive Monte "
+            "Carlo until standard error is at most X"
+        ),
+    )
+    parser.add_argument(
+        "--stratified",
+        action="store_true",
+        help="Stratify adaptive Monte Carlo by integer hue",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        help=(
+            "Number of worker processes. Output doesn't depend on N. Adaptive "
+            "Monte Carlo (with '--target-se') is always done sequentially."
+        ),
+    )
+    args = parser.parse_args(argv)
+
+    if args.lut is not None:
+        print("Loading lookup table")
+        _load_lut(args.lut)
+
+    # Worker processes are shut down even if some stage fails
+    if args.workers is None:
+        pool = contextlib.nullcontext()
+    else:
+        pool = ProcessPoolExecutor(max_workers=args.workers)
+    with pool as executor:
+        # Colors are processed in chunks with two passes over RGB cube: first
+        # to compute cusps, second to compute colors outside of triangle.
+        # Results of chunks are merged in grid order, so output doesn't depend
+        # on workers.
+        chunk_kwargs = dict(
+            chunk_size=args.chunk_size, lut_path=args.lut, executor=executor
+        )
+
+        # Cusps
+        print("Computing cusps")
+        cusps = compute_cusp_data(
+            map_color_chunks(find_max_chroma_colors, **chunk_kwargs)
+        )
+
+        print("Saving cusps")
+        cusps.to_csv("cusps.csv", index=False)
+
+        cusps_diff = compare_with_analytic_cusps(cusps).set_index("hue_floor").abs()
+        print(
+            "  Max absolute difference with analytic cusps: "
+            f"L={cusps_diff['L'].max():.2f} (hue {cusps_diff['L'].idxmax()}), "
+            f"c={cusps_diff['c'].max():.2f} (hue {cusps_diff['c'].idxmax()})"
+        )
+
+        # Colors outside of triangle
+        print("Computing colors outside of triangle")
+        colors_outside_triangle = merge_colors_outside_triangle(
+            map_color_chunks(
+                compute_chunk_colors_outside_triangle, cusps, **chunk_kwargs
+            )
+        )
+
+        print("Saving colors outside of triangle")
+        colors_outside_triangle.to_csv("colors_outside_triangle.csv", index=False)
+
+        print("Generating share of triangles outside of RGB")
+        if args.target_se is None:
+            share_outside = compute_triangle_share_outside_rgb_gamut(
+                cusps, size=1_000_000, executor=executor
+            )
+            print(f"  The answer is approximately {100 * share_outside:.2f}")
+        else:
+            share_outside, se, size = estimate_triangle_share_outside_rgb_gamut(
+                cusps, target_se=args.target_se, stratified=args.stratified
+            )
+            print(
+                f"  The answer is approximately {100 * share_outside:.2f} "
+                f"(95% CI: +-{100 * 1.96 * se:.2f}, {size} points)"
+            )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+"""
+Fused sRGB in [0;1] <-> Oklab conversion kernels for big inputs.
+
+Each kernel goes over data once instead of doing separate full-array passes for
+transfer function, matrix multiplications, cube (root), and gray snapping:
+- "numpy" backend (default) applies `conversion` functions in place to
+  cache-sized blocks of columns, so intermediate data stays in cache. Results
+  are identical to `conversion` functions. It is ~1.5 times faster on 2^24
+  colors.
+- "numba" backend (requires `numba`) computes every color in a single compiled
+  loop in parallel threads. Results match `conversion` functions up to 1e-12
+  absolute difference (due to different implementations of `pow` and `cbrt`).
+  It uses scalar `pow` and `cbrt` which are several times slower than SIMD
+  versions in NumPy, so it is beneficial only with many CPU cores.
+
+Notes:
+- Input and output have the same layout as in `conversion`: colors as columns.
+"""
+
+import numpy as np
+from numpy.typing import DTypeLike, NDArray
+
+from oklab import conversion
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS = ("numba", "numpy")
+
+
+def rgb2oklab(
+    rgb: NDArray,
+    dtype: DTypeLike = None,
+    out: NDArray | None = None,
+    backend: str = "numpy",
+    block_size: int = 2**14,
+) -> NDArray:
+    return _apply_kernel("rgb2oklab", rgb, dtype, out, backend, block_size)
+
+
+def oklab2rgb(
+    oklab: NDArray,
+    dtype: DTypeLike = None,
+    out: NDArray | None = None,
+    backend: str = "numpy",
+    block_size: int = 2**14,
+) -> NDArray:
+    return _apply_kernel("oklab2rgb", oklab, dtype, out, backend, block_size)
+
+
+def _apply_kernel(name, x, dtype, out, backend, block_size):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend!r}")
+    if backend == "numba" and numba is None:
+        raise ImportError("Backend 'numba' requires `numba` package")
+
+    x = np.asarray(x)
+    if out is None:
+        out = np.empty(x.shape, dtype=np.float64 if dtype is None else dtype)
+
+    if backend == "numba":
+        matrices = _kernel_matrices[name]
+        _numba_kernels[name](x, out, *(m.astype(out.dtype) for m in matrices))
+        return out
+
+    fun = getattr(conversion, name)
+    for start in range(0, x.shape[1], block_size):
+        block = slice(start, start + block_size)
+        fun(x[:, block], out=out[:, block])
+    return out
+
+
+_kernel_matrices = {
+    "rgb2oklab": (
+        conversion.conversion_matricies["linrgb2lms"],
+        conversion.conversion_matricies["cbrtlms2oklab"],
+    ),
+    "oklab2rgb": (
+        conversion.conversion_matricies["oklab2cbrtlms"],
+        conversion.conversion_matricies["lms2linrgb"],
+    ),
+}
+
+_numba_kernels = {}
+
+if numba is not None:
+
+    @numba.njit(cache=True, inline="always")
+    def _dot(m, i, x0, x1, x2):
+        return m[i, 0] * x0 + m[i, 1] * x1 + m[i, 2] * x2
+
+    @numba.njit(cache=True, inline="always")
+    def _to_linear(x):
+        x = min(max(x, 0.0), 1.0)
+        return ((x + 0.055) / 1.055) ** 2.4 if 0.04045 < x else x / 12.92
+
+    @numba.njit(cache=True, inline="always")
+    def _from_linear(x):
+        x = min(max(x, 0.0), 1.0)
+        return 12.92 * x if 0.0031308 >= x else 1.055 * x**0.416666667 - 0.055
+
+    @numba.njit(cache=True, parallel=True)
+    def _rgb2oklab_numba(rgb, out, m1, m2):
+        for j in numba.prange(rgb.shape[1]):
+            r, g, b = (
+                _to_linear(rgb[0, j]),
+                _to_linear(rgb[1, j]),
+                _to_linear(rgb[2, j]),
+            )
+            l_ = np.cbrt(_dot(m1, 0, r, g, b))
+            m_ = np.cbrt(_dot(m1, 1, r, g, b))
+            s_ = np.cbrt(_dot(m1, 2, r, g, b))
+            out[0, j] = _dot(m2, 0, l_, m_, s_)
+            out[1, j] = _dot(m2, 1, l_, m_, s_)
+            out[2, j] = _dot(m2, 2, l_, m_, s_)
+
+            # Explicitly convert gray colors
+            if abs(out[1, j]) < 1e-5 and abs(out[2, j]) < 1e-5:
+                out[1, j] = 0.0
+                out[2, j] = 0.0
+
+    @numba.njit(cache=True, parallel=True)
+    def _oklab2rgb_numba(oklab, out, m1, m2):
+        for j in numba.prange(oklab.shape[1]):
+            L, a, b = oklab[0, j], oklab[1, j], oklab[2, j]
+            l = _dot(m1, 0, L, a, b) ** 3
+            m = _dot(m1, 1, L, a, b) ** 3
+            s = _dot(m1, 2, L, a, b) ** 3
+            out[0, j] = _from_linear(_dot(m2, 0, l, m, s))
+            out[1, j] = _from_linear(_dot(m2, 1, l, m, s))
+            out[2, j] = _from_linear(_dot(m2, 2, l, m, s))
+
+    _numba_kernels["rgb2oklab"] = _rgb2oklab_numba
+    _numba_kernels["oklab2rgb"] = _oklab2rgb_numba
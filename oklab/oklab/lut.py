@@ -0,0 +1,67 @@
+"""
+Lookup table (LUT) with Oklch coordinates of all 24-bit sRGB colors.
+
+Table has shape (2^24, 3) and its row at index 0xRRGGBB contains (L, c, h) of
+that color as computed by `conversion.rgb2oklch()`: L and c are in range [0; 1]
+and lightness is not corrected.
+
+Table is stored on disk as '.npy' file and is memory-mapped on load. This makes
+loading almost instant and any lookup an indexed gather which reads only
+necessary pages. Default `float32` storage takes 192 MiB and is accurate up to
+~1e-7 relative error (use `float64` to get exactly `rgb2oklch()` output).
+"""
+import os
+
+import numpy as np
+from numpy.typing import ArrayLike, DTypeLike, NDArray
+
+from oklab import conversion
+
+N_COLORS = 2**24
+DEFAULT_PATH = "oklch_lut.npy"
+
+
+def build_lut(
+    path: str = DEFAULT_PATH, dtype: DTypeLike = np.float32, chunk_size: int = 2**20
+) -> NDArray:
+    # Write into temporary file first to not leave partially built table
+    tmp_path = f"{path}.tmp"
+    lut = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype=dtype, shape=(N_COLORS, 3)
+    )
+    for start in range(0, N_COLORS, chunk_size):
+        end = min(start + chunk_size, N_COLORS)
+        rgb = conversion.int2rgb(np.arange(start, end))
+        lut[start:end, :] = conversion.rgb2oklch(rgb).T
+    lut.flush()
+    del lut
+    os.replace(tmp_path, path)
+
+    return load_lut(path, build=False)
+
+
+# If `dtype` is supplied, table is built with it and loaded table must have it
+def load_lut(
+    path: str = DEFAULT_PATH, build: bool = True, dtype: DTypeLike = None
+) -> NDArray:
+    if build and not os.path.exists(path):
+        return build_lut(path, dtype=np.float32 if dtype is None else dtype)
+
+    lut = np.load(path, mmap_mode="r")
+    if lut.shape != (N_COLORS, 3):
+        raise ValueError(f"File {path!r} is not a valid Oklch lookup table")
+    if dtype is not None and lut.dtype != dtype:
+        raise ValueError(
+            f"Oklch lookup table {path!r} has '{lut.dtype}' data type instead of "
+            f"'{np.dtype(dtype)}'"
+        )
+    return lut
+
+
+# Output is the same as of `rgb2oklch()` but for packed 24-bit colors
+def int2oklch(x: ArrayLike, lut: NDArray) -> NDArray:
+    return lut[np.asarray(x, dtype=np.uint32)].T.astype(np.float64)
+
+
+def rgb2oklch(rgb: NDArray, lut: NDArray) -> NDArray:
+    return int2oklch(conversion.rgb2int(rgb), lut)
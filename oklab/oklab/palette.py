@@ -0,0 +1,197 @@
+"""
+Nearest color search inside a fixed palette based on Euclidean distance in Oklab
+color space (coordinates in [0; 1] with uncorrected lightness).
+
+Search is done with a uniform grid over Oklab space. For every grid cell there
+is a precomputed list of palette colors which can be among `k` nearest to any
+point inside the cell. Lists are padded to the same length, so batched query is
+a gather of candidates and selection of nearest among them. Points outside of
+grid (which covers all sRGB colors and palette) are compared with whole palette.
+
+For 8-bit sRGB input there is an option to precompute nearest palette index for
+all 2^24 colors, which turns quantization into a single indexed gather. Building
+this table queries all colors and takes 10-30 seconds (more for bigger palettes)
+in every process, so it can be saved as '.npy' file (16 MiB for palettes of up
+to 256 colors) and memory-mapped on later loads, like `oklab.lut`. Default file
+name contains hash of palette colors.
+"""
+import hashlib
+import os
+
+import numpy as np
+from numpy.typing import ArrayLike, NDArray
+
+from oklab import conversion
+
+# Number of 24-bit colors in table of nearest palette colors
+_n_table_colors = 2**24
+
+# Bounds of sRGB gamut in Oklab with small padding
+_srgb_oklab_bounds = np.array([[-0.01, -0.25, -0.33], [1.01, 0.29, 0.21]])
+
+
+class PaletteIndex:
+    def __init__(self, hex: ArrayLike, k: int = 1, n_cells: int = 32):
+        # `k` is the maximum number of nearest neighbors to be queried
+        self.hex = conversion.int2hex(conversion.hex2int(hex))
+        self.oklab = conversion.rgb2oklab(conversion.hex2rgb(self.hex))
+        self.k = min(k, self.oklab.shape[1])
+        self.table = None
+
+        bounds = _srgb_oklab_bounds
+        self._lower = np.minimum(bounds[0], self.oklab.min(axis=1))
+        self._upper = np.maximum(bounds[1], self.oklab.max(axis=1))
+        self._n_cells = n_cells
+        self._candidates = self._compute_candidates()
+
+        # Palette with extra infinitely distant color used as padding
+        self._oklab_padded = np.concatenate(
+            [self.oklab, np.full((3, 1), np.inf)], axis=1
+        )
+
+    def _compute_candidates(self) -> NDArray:
+        n, m = self._n_cells, self.oklab.shape[1]
+        edges = np.linspace(self._lower, self._upper, n + 1).T
+
+        # Squared distances per axis from cells to palette colors: minimum (zero
+        # if inside cell along axis) and maximum (to the farthest cell edge)
+        lo, hi = edges[:, :-1, np.newaxis], edges[:, 1:, np.newaxis]
+        p = self.oklab[:, np.newaxis, :]
+        dist_min = np.maximum(np.maximum(lo - p, p - hi), 0) ** 2
+        dist_max = np.maximum(np.abs(p - lo), np.abs(p - hi)) ** 2
+
+        # Color can be among `k` nearest if its minimum distance is not bigger
+        # than `k`-th smallest maximum distance
+        def grid_sum(x):
+            return x[0][:, None, None] + x[1][None, :, None] + x[2][None, None, :]
+
+        dist_min = grid_sum(dist_min).reshape(-1, m)
+        dist_max = grid_sum(dist_max).reshape(-1, m)
+        threshold = np.partition(dist_max, self.k - 1, axis=1)[:, [self.k - 1]]
+        is_candidate = dist_min <= threshold
+
+        # Pad candidate lists with index of infinitely distant color. Stable sort
+        # keeps palette order, so ties are resolved as in brute-force search.
+        n_candidates = is_candidate.sum(axis=1).max()
+        order = np.argsort(~is_candidate, axis=1, kind="stable")[:, :n_candidates]
+        is_candidate = np.take_along_axis(is_candidate, order, axis=1)
+        return np.where(is_candidate, order, m)
+
+    def query(self, oklab: NDArray, k: int = 1, block_size: int = 2**16):
+        # Return arrays of shape (k, n) with distances and indices of `k`
+        # nearest palette colors (in order of increasing distance) for colors
+        # stored as columns of `oklab`
+        if self.k < k:
+            raise ValueError(f"Index is built for at most {self.k} nearest colors")
+        oklab = np.asarray(oklab, dtype=np.float64).reshape(3, -1)
+        n = oklab.shape[1]
+        dist, ind = np.empty((k, n)), np.empty((k, n), dtype=np.intp)
+        for start in range(0, n, block_size):
+            block = slice(start, start + block_size)
+            dist[:, block], ind[:, block] = self._query_block(oklab[:, block], k)
+        return dist, ind
+
+    def _query_block(self, oklab: NDArray, k: int):
+        scaled = (oklab - self._lower[:, None]) / (self._upper - self._lower)[:, None]
+        cell = np.floor(self._n_cells * scaled).astype(np.intp)
+        is_inside = ((0 <= cell) & (cell < self._n_cells)).all(axis=0)
+        if not is_inside.all():
+            return self._query_block_outside(oklab, k, cell, is_inside)
+
+        cell_id = (cell[0] * self._n_cells + cell[1]) * self._n_cells + cell[2]
+        return self._find_nearest(oklab, self._candidates[cell_id], k)
+
+    def _query_block_outside(self, oklab, k, cell, is_inside):
+        # Points outside of grid are compared with whole palette
+        dist, ind = np.empty((k, oklab.shape[1])), np.empty((k, oklab.shape[1]), int)
+        inside = oklab[:, is_inside]
+        cell = cell[:, is_inside]
+        cell_id = (cell[0] * self._n_cells + cell[1]) * self._n_cells + cell[2]
+        dist[:, is_inside], ind[:, is_inside] = self._find_nearest(
+            inside, self._candidates[cell_id], k
+        )
+
+        outside = oklab[:, ~is_inside]
+        all_colors = np.arange(self.oklab.shape[1])
+        candidates = np.broadcast_to(all_colors, (outside.shape[1], len(all_colors)))
+        dist[:, ~is_inside], ind[:, ~is_inside] = self._find_nearest(
+            outside, candidates, k
+        )
+        return dist, ind
+
+    def _find_nearest(self, oklab: NDArray, candidates: NDArray, k: int):
+        diff = self._oklab_padded[:, candidates] - oklab[:, :, np.newaxis]
+        dist2 = (diff**2).sum(axis=0)
+        if k == 1:
+            nearest = np.argmin(dist2, axis=1)[:, np.newaxis]
+        else:
+            nearest = np.argsort(dist2, axis=1, kind="stable")[:, :k]
+        dist = np.sqrt(np.take_along_axis(dist2, nearest, axis=1))
+        ind = np.take_along_axis(candidates, nearest, axis=1)
+        return dist.T, ind.T
+
+    def query_hex(self, hex: ArrayLike, k: int = 1):
+        return self.query(conversion.rgb2oklab(conversion.hex2rgb(hex)), k=k)
+
+    def build_table(self, chunk_size: int = 2**20, path: str | None = None) -> NDArray:
+        # Precompute index of nearest palette color for all 24-bit colors. If
+        # `path` is supplied, table is saved there and memory-mapped.
+        if path is None:
+            table = np.empty(_n_table_colors, dtype=self._table_dtype)
+        else:
+            # Write into temporary file first to not leave partially built table
+            table = np.lib.format.open_memmap(
+                f"{path}.tmp",
+                mode="w+",
+                dtype=self._table_dtype,
+                shape=(_n_table_colors,),
+            )
+        for start in range(0, _n_table_colors, chunk_size):
+            end = min(start + chunk_size, _n_table_colors)
+            oklab = conversion.rgb2oklab(conversion.int2rgb(np.arange(start, end)))
+            table[start:end] = self.query(oklab)[1][0]
+
+        if path is not None:
+            table.flush()
+            del table
+            os.replace(f"{path}.tmp", path)
+            return self.load_table(path, build=False)
+        self.table = table
+        return table
+
+    def load_table(self, path: str | None = None, build: bool = True) -> NDArray:
+        # Memory-map table saved by `build_table()` (at `table_path()` by
+        # default). If file doesn't exist, table is built and saved.
+        path = self.table_path() if path is None else path
+        if build and not os.path.exists(path):
+            return self.build_table(path=path)
+
+        table = np.load(path, mmap_mode="r")
+        if table.shape != (_n_table_colors,) or table.dtype != self._table_dtype:
+            raise ValueError(f"File {path!r} is not a valid palette table")
+        self.table = table
+        return table
+
+    def table_path(self, directory: str = ".") -> str:
+        # File name is unique for palette colors and their order
+        digest = hashlib.sha256(",".join(self.hex.tolist()).encode()).hexdigest()
+        return os.path.join(directory, f"palette_table_{digest[:16]}.npy")
+
+    @property
+    def _table_dtype(self):
+        return np.uint8 if self.oklab.shape[1] <= 256 else np.uint32
+
+    def quantize(self, x: ArrayLike) -> NDArray:
+        # Index of nearest palette color for packed 24-bit colors. Uses
+        # precomputed table if it is built.
+        x = np.asarray(x, dtype=np.uint32)
+        if self.table is not None:
+            return self.table[x]
+        oklab = conversion.rgb2oklab(conversion.int2rgb(x.reshape(-1)))
+        return self.query(oklab)[1][0].reshape(x.shape)
+
+    def __str__(self):
+        return (
+            f"Nearest color index for palette of {self.oklab.shape[1]} colors "
+            f"(up to {self.k} nearest)"
+        )
@@ -0,0 +1,188 @@
+"""
+Pure Python conversion between HEX and Oklab/Oklch for a few colors.
+
+This is a fast path for tools which convert a handful of colors per call: it
+doesn't import NumPy (which takes most of startup time) and avoids array
+overhead. For many colors use `oklab.conversion` (which uses this module for
+small inputs with `small_fast_path=True`).
+
+Notes:
+- Colors are tuples of three coordinates, functions take and return lists of
+  them. Coordinates are in the same ranges as in `conversion`.
+- Results are not bit-identical to `conversion`, as pure Python math functions
+  round differently from NumPy ones. On 200k random colors coordinates differ
+  by up to ~1e-13 for L, a, b, c and ~1e-11 for hue (in degrees). HEX output
+  matched on all tested colors.
+"""
+
+import math
+
+# Conversion matrices (also used to create NumPy arrays in `conversion`)
+matrices = {
+    "linrgb2lms": (
+        (0.4122214708, 0.5363325363, 0.0514459929),
+        (0.2119034982, 0.6806995451, 0.1073969566),
+        (0.0883024619, 0.2817188376, 0.6299787005),
+    ),
+    "cbrtlms2oklab": (
+        (+0.2104542553, +0.7936177850, -0.0040720468),
+        (+1.9779984951, -2.4285922050, +0.4505937099),
+        (+0.0259040371, +0.7827717662, -0.8086757660),
+    ),
+    "oklab2cbrtlms": (
+        (+1.0, +0.3963377774, +0.2158037573),
+        (+1.0, -0.1055613458, -0.0638541728),
+        (+1.0, -0.0894841775, -1.2914855480),
+    ),
+    "lms2linrgb": (
+        (+4.0767416621, -3.3077115913, +0.2309699292),
+        (-1.2684380046, +2.6097574011, -0.3413193965),
+        (-0.0041960863, -0.7034186147, +1.7076147010),
+    ),
+}
+
+
+# HEX <-> Oklch
+# Operations are done in the same order as in `conversion`
+def hex2oklch(hex: list, correct_l: bool = True) -> list:
+    res = []
+    for x in hex:
+        L, c, h = _oklab2oklch(rgb2oklab(hex2rgb(x)))
+        L = correct_lightness(100 * L) if correct_l else 100 * L
+        res.append((L, 100 * c, h))
+    return res
+
+
+def oklch2hex(oklch: list, correct_l: bool = True) -> list:
+    res = []
+    for L, c, h in oklch:
+        L = correct_lightness_inv(L) if correct_l else L
+        oklab = _oklch2oklab((0.01 * L, 0.01 * c, h))
+        res.append(rgb2hex(oklab2rgb(oklab)))
+    return res
+
+
+# HEX <-> Oklab
+def hex2oklab(hex: list, correct_l: bool = True) -> list:
+    res = []
+    for x in hex:
+        L, a, b = rgb2oklab(hex2rgb(x))
+        L = correct_lightness(100 * L) if correct_l else 100 * L
+        res.append((L, 100 * a, 100 * b))
+    return res
+
+
+def oklab2hex(oklab: list, correct_l: bool = True) -> list:
+    res = []
+    for L, a, b in oklab:
+        L = correct_lightness_inv(L) if correct_l else L
+        res.append(rgb2hex(oklab2rgb((0.01 * L, 0.01 * a, 0.01 * b))))
+    return res
+
+
+# HEX <-> RGB in [0;1] for single color
+# Accepts '#rrggbb', 'rrggbb', '#rgb', and 'rgb' (case insensitive)
+def hex2rgb(hex: str) -> tuple:
+    digits = hex[1:] if hex.startswith("#") else hex
+    if len(digits) == 3:
+        digits = "".join(d + d for d in digits)
+    if len(digits) != 6 or not all(d in _hex_chars for d in digits):
+        raise ValueError(f"Invalid HEX color: {hex!r}")
+    x = int(digits, 16)
+    return ((x >> 16) / 255, ((x >> 8) & 255) / 255, (x & 255) / 255)
+
+
+def rgb2hex(rgb: tuple) -> str:
+    # Use clamp gamut clipping (as in `conversion.rgb2int()`)
+    r, g, b = rgb
+    return "#%02x%02x%02x" % (_to_byte(r), _to_byte(g), _to_byte(b))
+
+
+_hex_chars = set("0123456789abcdefABCDEF")
+
+
+# RGB in [0;1] <-> Oklab for single color
+def rgb2oklab(rgb: tuple) -> tuple:
+    r, g, b = rgb
+    l, m, s = _matmul(_linrgb2lms, (_to_linear(r), _to_linear(g), _to_linear(b)))
+    L, a, b = _matmul(_cbrtlms2oklab, (_cbrt(l), _cbrt(m), _cbrt(s)))
+
+    # Explicitly convert gray colors
+    if abs(a) < 1e-5 and abs(b) < 1e-5:
+        a, b = 0.0, 0.0
+    return (L, a, b)
+
+
+def oklab2rgb(oklab: tuple) -> tuple:
+    l, m, s = _matmul(_oklab2cbrtlms, oklab)
+    r, g, b = _matmul(_lms2linrgb, (l**3, m**3, s**3))
+    return (_from_linear(r), _from_linear(g), _from_linear(b))
+
+
+# Matrices as local names to avoid dictionary lookups in loops
+_linrgb2lms, _cbrtlms2oklab = matrices["linrgb2lms"], matrices["cbrtlms2oklab"]
+_oklab2cbrtlms, _lms2linrgb = matrices["oklab2cbrtlms"], matrices["lms2linrgb"]
+
+
+def _oklab2oklch(oklab):
+    L, a, b = oklab
+    return (L, math.sqrt(a**2 + b**2), math.degrees(math.atan2(b, a)) % 360)
+
+
+def _oklch2oklab(oklch):
+    L, c, h = oklch
+    h = math.radians(h % 360)
+    return (L, c * math.cos(h), c * math.sin(h))
+
+
+def _to_linear(x):
+    # Clip to [0; 1] with comparisons, as `min()` and `max()` are slower
+    x = 0.0 if x < 0.0 else 1.0 if x > 1.0 else x
+    return x / 12.92 if x <= 0.04045 else ((x + 0.055) / 1.055) ** 2.4
+
+
+def _from_linear(x):
+    x = 0.0 if x < 0.0 else 1.0 if x > 1.0 else x
+    return 12.92 * x if 0.0031308 >= x else 1.055 * x**0.416666667 - 0.055
+
+
+def _to_byte(x):
+    x = round(255 * x)
+    return 0 if x < 0 else 255 if x > 255 else x
+
+
+def _cbrt(x):
+    # Refine with one Newton step, as power with 1/3 exponent can be off by a
+    # few units in the last place
+    if x == 0:
+        return 0.0
+    y = math.copysign(abs(x) ** (1 / 3), x)
+    return y - (y * y * y - x) / (3 * y * y)
+
+
+def _matmul(m, x):
+    (m00, m01, m02), (m10, m11, m12), (m20, m21, m22) = m
+    x0, x1, x2 = x
+    return (
+        m00 * x0 + m01 * x1 + m02 * x2,
+        m10 * x0 + m11 * x1 + m12 * x2,
+        m20 * x0 + m21 * x1 + m22 * x2,
+    )
+
+
+# Source:
+# https://bottosson.github.io/posts/colorpicker/#intermission---a-new-lightness-estimate-for-oklab
+# Assume both input and output in range [0; 100] instead of [0; 1]
+def correct_lightness(x: float) -> float:
+    x = 0.01 * x
+    k_1, k_2 = 0.206, 0.03
+    k_3 = (1 + k_1) / (1 + k_2)
+    res = 0.5 * (k_3 * x - k_1 + math.sqrt((k_3 * x - k_1) ** 2 + 4 * k_2 * k_3 * x))
+    return 100 * res
+
+
+def correct_lightness_inv(x: float) -> float:
+    x = 0.01 * x
+    k_1, k_2 = 0.206, 0.03
+    k_3 = (1 + k_1) / (1 + k_2)
+    return 100 * (x * (x + k_1) / (k_3 * (x + k_2)))
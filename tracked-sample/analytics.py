@@ -0,0 +1,190 @@
+"""
+Analytics of tracked random sampling.
+
+Empirical statistics of draw sequences:
+- `repeat_gaps()` and `repeat_gap_counts()` : distance from every draw to the
+  previous draw of the same element.
+- `element_frequencies()` : number of draws of every element.
+
+Exact statistics for given pool index weights, based on Markov chain of pool
+index ("rank") of a single element. If element has rank `r` and index `j` is
+drawn, its next rank is 0 if `j == r`, `r + 1` if `j > r`, and `r` otherwise:
+- `rank_transition_matrix()` : transition matrix of this chain.
+- `stationary_distribution()` : its stationary distribution.
+- `repeat_gap_probabilities()` : exact distribution of repeat gaps, which can
+  be compared with `repeat_gap_counts()` without simulating many draws.
+
+Notes:
+- Transition matrix of ranks is doubly stochastic (every rank is occupied by
+  exactly one element), so uniform distribution is always stationary. It is
+  the only one if every rank can be reached and left, i.e. all weights except
+  for some first ones are positive. Otherwise elements at ranks after the last
+  positive weight are never drawn and stay at their ranks forever.
+"""
+
+import numpy as np
+
+
+def repeat_gaps(x):
+    """Compute gaps between repeated draws
+
+    Gap of a draw is the number of draws since the previous draw of the same
+    element. It is computed in a single pass over draws, which keeps index of
+    the last draw of every seen element. This takes O(n) time for n draws.
+
+    Parameters
+    ----------
+    x : Sequence of hashable elements
+        Draws in order they were made.
+
+    Returns
+    -------
+    gaps : numpy.ndarray
+        Integer array with gap for every draw. Draws without previous
+        occurrence of the same element have gap 0.
+    """
+    if isinstance(x, np.ndarray):
+        x = x.tolist()
+
+    last = {}
+    gaps = [0] * len(x)
+    for i, item in enumerate(x):
+        prev = last.get(item)
+        if prev is not None:
+            gaps[i] = i - prev
+        last[item] = i
+    return np.array(gaps, dtype=np.intp)
+
+
+def repeat_gap_counts(x):
+    """Count gaps between repeated draws
+
+    Parameters
+    ----------
+    x : Sequence of hashable elements
+        Draws in order they were made.
+
+    Returns
+    -------
+    counts : numpy.ndarray
+        Array in which element with index `g` is the number of draws which
+        repeat draw made `g` draws before (with no draws of the same element
+        in between). Element with index 0 is always 0.
+    """
+    gaps = repeat_gaps(x)
+    return np.bincount(gaps[gaps > 0], minlength=1)
+
+
+def element_frequencies(x):
+    """Count draws of every element
+
+    Parameters
+    ----------
+    x : Sequence of hashable elements
+        Draws in order they were made.
+
+    Returns
+    -------
+    values : numpy.ndarray
+        Sorted unique drawn elements.
+    counts : numpy.ndarray
+        Number of draws of every element from `values`.
+    """
+    return np.unique(np.asarray(x), return_counts=True)
+
+
+def rank_transition_matrix(weights):
+    """Compute transition matrix of a single element's pool index
+
+    Parameters
+    ----------
+    weights : Sequence of non-negative numbers
+        Weights of pool indices (as in `TrackedSample`).
+
+    Returns
+    -------
+    matrix : numpy.ndarray
+        Square matrix in which element `[r, s]` is probability of element at
+        pool index `r` to be at pool index `s` after one draw.
+    """
+    p = _index_probabilities(weights)
+    n = len(p)
+    # Probabilities of drawing index before and after every index
+    p_before = np.cumsum(p) - p
+    p_after = np.maximum(1 - np.cumsum(p), 0)
+
+    matrix = np.zeros((n, n))
+    ranks = np.arange(n)
+    matrix[ranks, ranks] = p_before
+    matrix[ranks[:-1], ranks[1:]] = p_after[:-1]
+    matrix[:, 0] += p
+    return matrix
+
+
+def stationary_distribution(weights):
+    """Compute stationary distribution of a single element's pool index
+
+    Parameters
+    ----------
+    weights : Sequence of non-negative numbers
+        Weights of pool indices (as in `TrackedSample`).
+
+    Returns
+    -------
+    distribution : numpy.ndarray
+        Probabilities of element to be at every pool index after many draws.
+        See notes in module documentation about when it is not unique.
+    """
+    matrix = rank_transition_matrix(weights)
+    n = matrix.shape[0]
+
+    # Solve `pi @ matrix = pi` together with `sum(pi) = 1`
+    a = np.vstack([matrix.T - np.eye(n), np.ones((1, n))])
+    b = np.concatenate([np.zeros(n), [1]])
+    pi = np.linalg.lstsq(a, b, rcond=None)[0]
+    return np.clip(pi, 0, None) / np.clip(pi, 0, None).sum()
+
+
+def repeat_gap_probabilities(weights, max_gap):
+    """Compute exact distribution of gaps between repeated draws
+
+    Just drawn element is at pool index 0. Distribution of its pool index is
+    then propagated draw by draw, accumulating probability of it being drawn.
+    This takes O(n * max_gap) time for pool of size n.
+
+    Parameters
+    ----------
+    weights : Sequence of non-negative numbers
+        Weights of pool indices (as in `TrackedSample`).
+    max_gap : int
+        The biggest gap to compute probability for.
+
+    Returns
+    -------
+    probabilities : numpy.ndarray
+        Array of length `max_gap + 1` in which element with index `g` is
+        probability of element to be drawn again exactly after `g` draws.
+        Element with index 0 is always 0. Multiplied by the number of repeated
+        draws, it is comparable with output of `repeat_gap_counts()`.
+    """
+    p = _index_probabilities(weights)
+    p_before = np.cumsum(p) - p
+    p_after = np.maximum(1 - np.cumsum(p), 0)
+
+    res = np.zeros(max_gap + 1)
+    rank_probs = np.zeros(len(p))
+    rank_probs[0] = 1
+    for gap in range(1, max_gap + 1):
+        res[gap] = rank_probs @ p
+        # Element which is not drawn either stays or moves one index further
+        moved = rank_probs[:-1] * p_after[:-1]
+        rank_probs = rank_probs * p_before
+        rank_probs[1:] += moved
+    return res
+
+
+def _index_probabilities(weights):
+    p = np.asarray(weights, dtype=np.float64)
+    if not p.sum() > 0:
+        raise ValueError("Total of weights must be greater than zero")
+    return p / p.sum()
@@ -1,6 +1,7 @@
 import random
 import numpy as np
 
+import analytics
 from tracked_sample import TrackedSample
 
 
@@ -35,3 +36,10 @@ print(np.bincount(rand_draw_not_n_recent_human))
 ## First `n_recent` periods should have 0 repeats and it should grow linearly
 ## for some time
 print(count_period_repeats(rand_draw_not_n_recent_human, periods=range(1, 11)))
+
+## Empirical distribution of gaps between repeats should be close to exact one
+gap_counts = analytics.repeat_gap_counts(rand_draw_not_n_recent_human)
+gap_probs = analytics.repeat_gap_probabilities(
+    not_n_recent_human_weights, max_gap=len(gap_counts) - 1
+)
+print(np.round(gap_probs * gap_counts.sum())[:15], gap_counts[:15])
@@ -1,5 +1,9 @@
+import bisect
+import itertools
 import random
 
+import numpy as np
+
 
 class TrackedSample:
     """Tracked random sampling
@@ -10,7 +14,9 @@ class TrackedSample:
 
     Drawing elements from a pool is an iterative (per single draw) procedure.
     One draw is done in the following way:
-    - Sample with supplied `weights` single index inside a pool.
+    - Sample with supplied `weights` single index inside a pool. If
+      `item_weights` are supplied, weight of index is multiplied by item weight
+      of element at that index.
     - Extract element from pool at that index, which will be returned as
       desired draw.
     - Put this element **at the beginning** of the pool.
@@ -18,13 +24,17 @@ class TrackedSample:
     Properties:
     - `pool` : Current state of sampling pool.
     - `weights` : Weights of pool indices.
+    - `item_weights` : Weights of elements.
+    - `backend` : Name of data structure used to store a pool.
 
     Public methods:
     - `draw()` : Draw `size` elements from current pool. Note that this affects
       the state of the pool.
     """
 
-    def __init__(self, x, weights=None, preshuffle=True):
+    def __init__(
+        self, x, weights=None, preshuffle=True, backend=None, item_weights=None
+    ):
         """Initialize tracked random sampling object
 
         Parameters
@@ -38,33 +48,86 @@ class TrackedSample:
             Whether to shuffle a pool once during creation. Useful if input is
             in no particular order and there is a need to start random sampling
             right away (the most common situation).
+        backend : str, optional
+            Data structure used to store a pool. One of:
+            - "list" : Python list. Single draw takes O(n) time for pool of
+              size n, but with small constant. Best for small pools.
+            - "fenwick" : Fenwick tree over "time of last draw". Single draw
+              takes O(log n) time. Best for pools with more than several
+              thousands elements.
+            Both backends produce the same draws for the same random state.
+            `None` means "list" without `item_weights` and "fenwick" with
+            them (the only one supporting them).
+        item_weights : Callable or sequence, optional
+            Weights of elements. Either function which takes element and
+            returns its weight or sequence of weights of `x` elements. Weight
+            of pool index at draw is a product of its weight from `weights`
+            and item weight of element at that index. This enables usage like
+            "Don't sample recent `k` elements and sample rest with probability
+            proportional to elements' lengths".
+            Weights of all elements are kept in a sum tree, which is updated
+            only for elements that change weight after a draw: drawn one and
+            ones moving across indices at which `weights` changes value. So
+            draw takes O(log n) time for `weights` with few distinct runs of
+            values (like "zeros then ones") and up to O(n log n) for `weights`
+            that change at every index.
         """
-        self._pool = list(x)
+        pool = list(x)
+        if item_weights is not None:
+            if callable(item_weights):
+                item_weights = [item_weights(item) for item in pool]
+            else:
+                item_weights = list(item_weights)
+                if len(item_weights) != len(pool):
+                    raise ValueError("The number of item weights does not match x")
+            pool = list(zip(pool, item_weights))
         if preshuffle:
-            random.shuffle(self._pool)
-
-        self._inds = list(range(len(x)))
+            random.shuffle(pool)
 
-        # For future, it can be useful for `weights` to be a function that is
-        # applied to current pool before each draw. For example, this enables
-        # usage "Don't sample recent `k` items and sample rest with probability
-        # proportional to items' lengths". This will introduce significant
-        # overhead, though.
+        if backend is None:
+            backend = "list" if item_weights is None else "fenwick"
+        if backend not in _pool_backends:
+            raise ValueError(f"`backend` should be one of {list(_pool_backends)}")
+        self._backend = backend
         self._weights = weights
+        self._item_weights = item_weights
+
+        if item_weights is None:
+            self._pool = _pool_backends[backend](pool)
+        elif backend == "fenwick":
+            rank_weights = [1] * len(pool) if weights is None else list(weights)
+            if len(rank_weights) != len(pool):
+                raise ValueError("The number of weights does not match x")
+            self._pool = _WeightedFenwickPool(pool, rank_weights)
+        else:
+            raise ValueError('`item_weights` are supported only by "fenwick" backend')
+
+        # Cumulative weights are computed once, so that draw doesn't take O(n)
+        # time for every call of `random.choices()`
+        self._n = len(pool)
+        self._cum_weights = (
+            None if weights is None else list(itertools.accumulate(weights))
+        )
 
     @property
     def pool(self):
-        return self._pool
+        return self._pool.to_list()
 
     @property
     def weights(self):
         return self._weights
 
+    @property
+    def item_weights(self):
+        return self._item_weights
+
+    @property
+    def backend(self):
+        return self._backend
+
     def _pop(self, index):
         """Return item at index and place it at the beginning"""
-        res = self._pool.pop(index)
-        self._pool.insert(0, res)
-        return res
+        return self._pool.pop(index)
 
     def draw(self, size=1):
         """Draw sample
@@ -86,12 +149,520 @@ class TrackedSample:
         draw : list
             List of drawn elements
         """
-        inds = random.choices(self._inds, weights=self._weights, k=size)
+        if self._item_weights is not None:
+            pop_random, rand = self._pool.pop_random, random.random
+            return [pop_random(rand) for _ in range(size)]
+
+        inds = random.choices(range(self._n), cum_weights=self._cum_weights, k=size)
         return [self._pop(i) for i in inds]
 
     def __str__(self):
         return (
             "Tracked sampling object with current pool "
             "(from most to least recently drawn):\n"
-            f"{self._pool}"
+            f"{self.pool}"
         )
+
+
+class NumpyTrackedSample(TrackedSample):
+    """Tracked random sampling with NumPy random generator
+
+    This is a version of `TrackedSample` optimized for drawing big samples
+    with fixed weights:
+    - Cumulative weights are computed once during creation.
+    - All pool indices of a sample are drawn in a single vectorized call.
+    - Elements are extracted from the pool in a tight loop over pool element
+      numbers (every extraction depends on all previous ones, so this step is
+      inherently sequential).
+
+    Draws are returned as NumPy array. They are different from ones of
+    `TrackedSample` because random numbers come from `numpy.random.Generator`
+    instead of `random` module.
+    """
+
+    def __init__(self, x, weights=None, preshuffle=True, backend=None, seed=None):
+        """Initialize tracked random sampling object
+
+        Parameters
+        ----------
+        x : Collection as a valid input to `list()`.
+            Represents elements, from which samples should be drawn.
+        weights : Sequence of non-negative numbers, optional
+            Weights of pool indices. `None` is treated as equal weights of
+            necessary length.
+        preshuffle : bool, optional
+            Whether to shuffle a pool once during creation.
+        backend : str, optional
+            Data structure used to store a pool. Same as in `TrackedSample`.
+            `None` means "list" for pools with at most 8000 elements and
+            "fenwick" for bigger ones.
+        seed : As `seed` argument in `numpy.random.default_rng()`, optional
+            Seed of random generator used for preshuffling and drawing.
+        """
+        self._rng = np.random.default_rng(seed)
+
+        items = list(x)
+        self._items = _as_item_array(items)
+
+        # Pool stores numbers of elements to make extraction loop fast
+        pool = np.arange(len(items))
+        if preshuffle:
+            self._rng.shuffle(pool)
+
+        if backend is None:
+            backend = "list" if len(items) <= _fenwick_min_size else "fenwick"
+        if backend not in _pool_backends:
+            raise ValueError(f"`backend` should be one of {list(_pool_backends)}")
+        self._backend = backend
+        self._pool = _pool_backends[backend](pool.tolist())
+
+        self._n = len(items)
+        self._weights = weights
+        self._item_weights = None
+        self._cum_weights = _cumulative_weights(weights, len(items))
+
+    @property
+    def pool(self):
+        return self._items[self._pool.to_list()].tolist()
+
+    def draw(self, size=1):
+        """Draw sample
+
+        Draw sample with the same algorithm as in `TrackedSample.draw()`.
+
+        Parameters
+        ----------
+        size : int, optional
+            Size of sample to draw, by default 1
+
+        Returns
+        -------
+        draw : numpy.ndarray
+            Array of drawn elements
+        """
+        inds = _draw_indices(self._rng, self._cum_weights, len(self._items), size)
+        inds = inds.tolist()
+        numbers = self._pool.pop_many(inds)
+        return self._items[np.array(numbers, dtype=np.intp)]
+
+
+class TrackedSampleBatch:
+    """Batch of independent tracked random samplings
+
+    This holds many pools of the same elements (one per "stream") with the
+    same weights, and draws from all of them in lockstep. Pools are stored as
+    2-D array of element numbers (one row per stream), so every draw is done
+    for all streams with a few vectorized operations.
+
+    Every stream has its own random generator. Stream number `k` produces the
+    same draws as `NumpyTrackedSample` with seed equal to `k`-th element of
+    `seed_sequences`, regardless of the number of streams and sizes of draws.
+    Random numbers of streams are generated in blocks of `block_size` per
+    stream, so that drawing one element per step (like in simulations with
+    lockstep updates) doesn't call every stream's generator on every step.
+
+    Properties:
+    - `pool` : Current state of sampling pools as 2-D array (one row per
+      stream).
+    - `weights` : Weights of pool indices.
+    - `n_streams` : Number of streams.
+    - `seed_sequences` : Seeds of streams' random generators.
+
+    Public methods:
+    - `draw()` : Draw `size` elements from all current pools. Note that this
+      affects the state of the pools.
+    """
+
+    def __init__(
+        self, x, n_streams, weights=None, preshuffle=True, seed=None, block_size=64
+    ):
+        """Initialize batch of tracked random sampling objects
+
+        Parameters
+        ----------
+        x : Collection as a valid input to `list()`.
+            Represents elements, from which samples should be drawn.
+        n_streams : int
+            Number of independent pools.
+        weights : Sequence of non-negative numbers, optional
+            Weights of pool indices. `None` is treated as equal weights of
+            necessary length.
+        preshuffle : bool, optional
+            Whether to shuffle every pool once during creation.
+        seed : As `seed` argument in `numpy.random.SeedSequence()`, optional
+            Seed from which independent seeds of streams are spawned. Can also
+            be a sequence of `n_streams` seeds or `SeedSequence` objects to
+            seed every stream directly.
+        block_size : int, optional
+            Number of random numbers generated per stream at once. Bigger
+            blocks mean fewer generator calls at the cost of `8 * n_streams *
+            block_size` bytes of memory. Doesn't affect draws.
+        """
+        items = list(x)
+        self._items = _as_item_array(items)
+        n = len(items)
+
+        if isinstance(seed, (list, tuple)):
+            if len(seed) != n_streams:
+                raise ValueError("The number of seeds does not match `n_streams`")
+            seed_sequences = [
+                (
+                    s
+                    if isinstance(s, np.random.SeedSequence)
+                    else np.random.SeedSequence(s)
+                )
+                for s in seed
+            ]
+        elif isinstance(seed, np.random.SeedSequence):
+            seed_sequences = seed.spawn(n_streams)
+        else:
+            seed_sequences = np.random.SeedSequence(seed).spawn(n_streams)
+        self._seed_sequences = seed_sequences
+        self._rngs = [np.random.default_rng(s) for s in seed_sequences]
+
+        self._pool = np.tile(np.arange(n, dtype=np.intp), (n_streams, 1))
+        if preshuffle:
+            for rng, pool in zip(self._rngs, self._pool):
+                rng.shuffle(pool)
+
+        self._weights = weights
+        self._cum_weights = _cumulative_weights(weights, n)
+
+        self._block_size = block_size
+        self._uniforms = np.empty((n_streams, 0))
+
+    @property
+    def pool(self):
+        return self._items[self._pool]
+
+    @property
+    def weights(self):
+        return self._weights
+
+    @property
+    def n_streams(self):
+        return self._pool.shape[0]
+
+    @property
+    def seed_sequences(self):
+        return self._seed_sequences
+
+    def draw(self, size=1):
+        """Draw sample from every stream
+
+        Draw sample with the same algorithm as in `TrackedSample.draw()`. Pool
+        indices for all draws are computed beforehand from stored blocks of
+        random numbers. Then every draw moves drawn elements to the beginning
+        of pools in all streams at once. It takes time proportional to number
+        of streams times the biggest drawn pool index.
+
+        Parameters
+        ----------
+        size : int, optional
+            Size of sample to draw from every stream, by default 1
+
+        Returns
+        -------
+        draw : numpy.ndarray
+            Array of drawn elements with shape `(n_streams, size)`
+        """
+        n_streams, n = self._pool.shape
+        inds = _uniforms_to_indices(self._take_uniforms(size), self._cum_weights, n)
+
+        pool, rows = self._pool, np.arange(n_streams)
+        numbers = np.empty((n_streams, size), dtype=np.intp)
+        for t in range(size):
+            ind = inds[:, t]
+            drawn = pool[rows, ind]
+            numbers[:, t] = drawn
+
+            # Shift elements before drawn ones one index further. Only first
+            # columns up to the biggest drawn index are affected.
+            m = ind.max() + 1
+            is_shifted = np.arange(1, m) <= ind[:, np.newaxis]
+            pool[:, 1:m] = np.where(is_shifted, pool[:, : m - 1], pool[:, 1:m])
+            pool[:, 0] = drawn
+
+        return self._items[numbers]
+
+    def _take_uniforms(self, size):
+        # Take next `size` random numbers of every stream. Generating them in
+        # blocks doesn't change them, as consecutive `random()` calls produce
+        # the same numbers as one call of combined size.
+        n_stored = self._uniforms.shape[1]
+        if n_stored < size:
+            block = np.empty((self.n_streams, max(self._block_size, size - n_stored)))
+            for rng, row in zip(self._rngs, block):
+                rng.random(out=row)
+            self._uniforms = np.concatenate([self._uniforms, block], axis=1)
+        res, self._uniforms = self._uniforms[:, :size], self._uniforms[:, size:]
+        return res
+
+    def __str__(self):
+        return (
+            f"Batch of {self.n_streams} tracked sampling objects with current "
+            "pools (from most to least recently drawn):\n"
+            f"{self.pool}"
+        )
+
+
+class _ListPool:
+    """Pool stored as Python list"""
+
+    def __init__(self, pool):
+        self._list = pool
+
+    def pop(self, index):
+        res = self._list.pop(index)
+        self._list.insert(0, res)
+        return res
+
+    def pop_many(self, indices):
+        # Tight loop with bound methods: sequence of pops can't be vectorized
+        # as every pop depends on the result of all previous ones
+        pool = self._list
+        pop, insert = pool.pop, pool.insert
+        res = []
+        append = res.append
+        for i in indices:
+            x = pop(i)
+            insert(0, x)
+            append(x)
+        return res
+
+    def to_list(self):
+        return self._list
+
+
+class _FenwickPool:
+    """Pool stored as Fenwick tree over "time of last draw"
+
+    Every element occupies a slot, and more recently drawn elements occupy
+    slots with bigger indices. So element at pool index `i` is the one in
+    `(n - i)`-th smallest occupied slot, which is found in O(log n) time with
+    Fenwick tree of slot occupancy. Drawn element is moved into the next unused
+    slot. When there are no unused slots, all elements are compacted into first
+    slots, which takes O(n) time once per O(n) draws.
+
+    Pool as list is materialized lazily and cached until the next draw.
+    """
+
+    def __init__(self, pool):
+        self._n = len(pool)
+        self._compact(list(reversed(pool)))
+
+    def _compact(self, items):
+        # `items` is a pool in order from least to most recently drawn
+        n = self._n
+        self._capacity = 2 * n + 1
+        self._items = [_empty_slot] + items + [_empty_slot] * (n + 1)
+        self._last_slot = n
+
+        # Build tree of slot occupancy in O(capacity) time
+        tree = [0] + [1] * n + [0] * (n + 1)
+        for i in range(1, self._capacity + 1):
+            parent = i + (i & -i)
+            if parent <= self._capacity:
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._list = None
+
+        self._top_bit = 1 << (self._capacity.bit_length() - 1)
+
+    def _add(self, slot, delta):
+        tree, capacity = self._tree, self._capacity
+        while slot <= capacity:
+            tree[slot] += delta
+            slot += slot & -slot
+
+    def _find_kth(self, k):
+        # Find slot which is `k`-th smallest occupied one
+        tree, capacity = self._tree, self._capacity
+        pos, step = 0, self._top_bit
+        while step > 0:
+            next_pos = pos + step
+            if next_pos <= capacity and tree[next_pos] < k:
+                pos = next_pos
+                k -= tree[pos]
+            step >>= 1
+        return pos + 1
+
+    def pop(self, index):
+        if not -self._n <= index < self._n:
+            raise IndexError("pop index out of range")
+        index %= self._n
+
+        slot = self._find_kth(self._n - index)
+        res = self._items[slot]
+        self._items[slot] = _empty_slot
+        self._add(slot, -1)
+        self._list = None
+
+        if self._last_slot == self._capacity:
+            items = [x for x in self._items if x is not _empty_slot]
+            self._compact(items + [res])
+            return res
+
+        self._last_slot += 1
+        self._items[self._last_slot] = res
+        self._add(self._last_slot, 1)
+        return res
+
+    def pop_many(self, indices):
+        pop = self.pop
+        return [pop(i) for i in indices]
+
+    def to_list(self):
+        if self._list is None:
+            items = self._items[self._last_slot : 0 : -1]
+            self._list = [x for x in items if x is not _empty_slot]
+        return self._list
+
+
+class _WeightedFenwickPool(_FenwickPool):
+    """Pool stored as Fenwick tree with weights of elements
+
+    Items are pairs of element and its item weight. Current weight of element
+    is its item weight multiplied by weight of its pool index. These weights
+    are stored in a second Fenwick tree over slots, which allows to draw an
+    element with probability proportional to its weight in O(log n) time.
+
+    Drawing element at index `i` moves elements at indices `0, ..., i - 1` one
+    index further. Only those of them which end up at index with different
+    weight (there is one per "breakpoint" of weights) need to be updated.
+    """
+
+    def __init__(self, pool, rank_weights):
+        self._rank_weights = rank_weights
+        self._breakpoints = [
+            i
+            for i in range(1, len(rank_weights))
+            if rank_weights[i] != rank_weights[i - 1]
+        ]
+        super().__init__(pool)
+
+    def _compact(self, items):
+        super()._compact(items)
+
+        # Rebuild weights from scratch, which also removes accumulated
+        # floating point errors of incremental updates
+        n, rank_weights = self._n, self._rank_weights
+        weights = [0] * (self._capacity + 1)
+        for slot in range(1, n + 1):
+            weights[slot] = self._items[slot][1] * rank_weights[n - slot]
+        self._weights = weights
+        self._total = sum(weights)
+
+        tree = list(weights)
+        for i in range(1, self._capacity + 1):
+            parent = i + (i & -i)
+            if parent <= self._capacity:
+                tree[parent] += tree[i]
+        self._weight_tree = tree
+
+    def _set_weight(self, slot, weight):
+        delta = weight - self._weights[slot]
+        if delta == 0:
+            return
+        self._weights[slot] = weight
+        self._total += delta
+        tree, capacity = self._weight_tree, self._capacity
+        while slot <= capacity:
+            tree[slot] += delta
+            slot += slot & -slot
+
+    def _find_by_weight(self, u):
+        # Find slot at which cumulative weight first exceeds `u`
+        tree, capacity = self._weight_tree, self._capacity
+        pos, step = 0, self._top_bit
+        while step > 0:
+            next_pos = pos + step
+            if next_pos <= capacity and tree[next_pos] <= u:
+                pos = next_pos
+                u -= tree[pos]
+            step >>= 1
+        return pos + 1
+
+    def _count_occupied(self, slot):
+        # Number of occupied slots not bigger than `slot`
+        tree, res = self._tree, 0
+        while slot > 0:
+            res += tree[slot]
+            slot -= slot & -slot
+        return res
+
+    def pop(self, index):
+        if not -self._n <= index < self._n:
+            raise IndexError("pop index out of range")
+        n, rank_weights = self._n, self._rank_weights
+        index %= n
+
+        # Update weights of elements which will move across breakpoints
+        n_moving = bisect.bisect_right(self._breakpoints, index)
+        for b in self._breakpoints[:n_moving]:
+            slot = self._find_kth(n - b + 1)
+            self._set_weight(slot, self._items[slot][1] * rank_weights[b])
+
+        self._set_weight(self._find_kth(n - index), 0)
+        res = super().pop(index)
+        self._set_weight(self._last_slot, res[1] * rank_weights[0])
+        return res[0]
+
+    def pop_random(self, random):
+        # Pop element with probability proportional to its weight using
+        # `random()` as source of uniform random numbers in [0; 1)
+        while True:
+            if not self._total > 0:
+                raise ValueError("Total of weights must be greater than zero")
+            slot = self._find_by_weight(random() * self._total)
+            # Guard against landing on slot without weight due to floating
+            # point errors of incremental updates
+            if slot <= self._capacity and self._weights[slot] > 0:
+                return self.pop(self._n - self._count_occupied(slot))
+
+    def to_list(self):
+        return [x for x, _ in super().to_list()]
+
+
+def _as_item_array(items):
+    res = np.empty(len(items), dtype=object)
+    res[:] = items
+    ## Use native data type if elements are scalars of the same type
+    types = {type(item) for item in items}
+    if len(types) == 1 and np.isscalar(items[0]):
+        res = np.array(items)
+    return res
+
+
+def _cumulative_weights(weights, n):
+    if weights is None:
+        return None
+    cum_weights = np.cumsum(np.asarray(weights, dtype=np.float64))
+    if len(cum_weights) != n:
+        raise ValueError("The number of weights does not match the pool")
+    if not cum_weights[-1] > 0:
+        raise ValueError("Total of weights must be greater than zero")
+    return cum_weights
+
+
+def _draw_indices(rng, cum_weights, n, size):
+    return _uniforms_to_indices(rng.random(size), cum_weights, n)
+
+
+def _uniforms_to_indices(u, cum_weights, n):
+    # Indices are computed from uniform numbers in [0; 1) (and not with
+    # `rng.integers()`), so that they can be generated in blocks of any size
+    if cum_weights is None:
+        return np.minimum((u * n).astype(np.intp), n - 1)
+    # Random numbers are strictly less than total weight, so index is always
+    # inside pool and indices with zero weight are never drawn
+    u = u * cum_weights[-1]
+    return np.searchsorted(cum_weights, u, side="right")
+
+
+_empty_slot = object()
+
+# Pool size above which "fenwick" backend is faster than "list" one
+_fenwick_min_size = 8000
+
+_pool_backends = {"list": _ListPool, "fenwick": _FenwickPool}
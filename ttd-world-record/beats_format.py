@@ -0,0 +1,95 @@
+import struct
+import zipfile
+
+import numpy as np
+
+# Binary format of beat timestamps is an uncompressed '.npz' file with arrays:
+# - "deltas" : 'int32' differences between consecutive timestamps in ticks
+#   (first one is relative to offset). This stays small and exact for any
+#   length of recording.
+# - "offset" : timestamp (in seconds) from which ticks are counted.
+# - "sample_rate" : number of ticks per second (1000 means milliseconds).
+# - "version" : version of format.
+# As file is not compressed, "deltas" is loaded as memory map without reading
+# whole file. Timestamps are then decoded with single cumulative sum.
+format_version = 1
+
+
+def encode_beats(beats, sample_rate=1000, offset=0.0):
+    """Convert sorted timestamps (in seconds) into deltas of ticks"""
+    ticks = np.round((np.asarray(beats, dtype=np.float64) - offset) * sample_rate)
+    deltas = np.diff(ticks.astype(np.int64), prepend=0)
+    if np.any(deltas[1:] < 0):
+        raise ValueError("Beats should be sorted")
+    if np.any(np.abs(deltas) > np.iinfo(np.int32).max):
+        raise ValueError("Differences between beats don't fit into 'int32'")
+    return deltas.astype(np.int32)
+
+
+def decode_beats(deltas, sample_rate=1000, offset=0.0):
+    """Convert deltas of ticks into timestamps (in seconds)"""
+    return offset + np.cumsum(deltas, dtype=np.int64) / sample_rate
+
+
+def save_beats(path, beats, sample_rate=1000, offset=0.0):
+    """Save beats in binary format ('.npz' file)"""
+    np.savez(
+        path,
+        deltas=encode_beats(beats, sample_rate=sample_rate, offset=offset),
+        offset=np.float64(offset),
+        sample_rate=np.int64(sample_rate),
+        version=np.int64(format_version),
+    )
+
+
+def load_deltas(path):
+    """Load deltas (as memory map), sample rate, and offset of binary beats"""
+    with np.load(path) as data:
+        if int(data["version"]) != format_version:
+            raise ValueError(f"Unsupported version of beats format in {path!r}")
+        sample_rate, offset = int(data["sample_rate"]), float(data["offset"])
+    return _memmap_npz_member(path, "deltas"), sample_rate, offset
+
+
+def load_beats(path):
+    """Load beat timestamps (in seconds) from binary or CSV file
+
+    Files with '.npz' extension are treated as binary, others as CSV.
+    """
+    if not str(path).endswith(".npz"):
+        return np.loadtxt(path, delimiter=",", ndmin=1)
+    deltas, sample_rate, offset = load_deltas(path)
+    return decode_beats(deltas, sample_rate=sample_rate, offset=offset)
+
+
+def export_csv(path, beats, decimals=3):
+    np.savetxt(path, beats, fmt=f"%.{decimals}f", delimiter=",")
+
+
+def _memmap_npz_member(path, name):
+    # Memory map array stored (without compression) inside '.npz' file: its
+    # '.npy' data is a contiguous part of file after local zip header
+    with zipfile.ZipFile(path) as zf:
+        info = zf.getinfo(f"{name}.npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        with np.load(path) as data:
+            return data[name]
+
+    with open(path, "rb") as f:
+        f.seek(info.header_offset)
+        local_header = f.read(30)
+        name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        data_offset = f.tell()
+
+    if np.prod(shape) == 0:
+        return np.empty(shape, dtype=dtype)
+    order = "F" if fortran_order else "C"
+    return np.memmap(
+        path, dtype=dtype, mode="r", offset=data_offset, shape=shape, order=order
+    )
@@ -1,64 +1,251 @@
+import argparse
+import hashlib
+import math
 import os
-import glob
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import librosa
+import soundfile as sf
 
-# Detect splitted audio files
-audio_files = glob.glob("ttd-world-record_audio[0-9][0-9][0-9].mp3")
-audio_files.sort()
+from beats_format import export_csv, save_beats
 
-# Audio material in seconds each audio file (except possibly last) contains
-# Needed to correctly produce beat timestamps relative to whole audio
-# This should be the same value as in `-segment_time` option to `ffmpeg`
-# splitting call
-split_period = 3600
+# Audio is analyzed in overlapping windows of `window_length` seconds, so memory
+# usage is bounded by window size and not by length of audio. Windows overlap
+# by `window_overlap` seconds: every window keeps only beats from its "own"
+# part, which goes from the middle of overlap with previous window to the middle
+# of overlap with the next one. This way beats near window edges (where beat
+# tracking lacks context) are taken from neighbor window and there are no
+# missed or duplicated beats at the joints.
+window_length = 600
+window_overlap = 30
 
-for i, file in enumerate(audio_files):
-    print(f"Processing {file}")
+# Audio is resampled to this sample rate before beat detection (as is done by
+# default in `librosa.load()`)
+sample_rate = 22050
 
-    # Load audio with its sample rate
-    print(f"  Loading audio file")
-    audio, sample_rate = librosa.load(file)
+# Number of audio samples between frames of onset strength envelope
+hop_length = 512
 
-    # # One can plot the whole audio, but it is very big to handle, so demonstrate
-    # # only first ten seconds
-    # audio_length = len(audio) / sample_rate
-    # times = np.linspace(0.0, audio_length, len(audio)) + i*split_period
-    # first_10_sec = slice(0, sample_rate * 10)
-    # plt.plot(times[first_10_sec], audio[first_10_sec])
+# Default prior estimate of tempo (in beats per minute) for beat tracking
+default_start_bpm = 160
 
-    # # Rough, but fast estimate of bounce time can be done by detecting onset
-    # # ("beginning of a musical note or other sound")
-    # audio_onset = librosa.onset.onset_detect(audio, sample_rate, units="time")
-    # print(audio_onset)
 
+# Beat detection is done in two steps: computing onset strength envelope of
+# audio (requires decoding audio and computing its spectrogram, which takes most
+# of the time) and tracking beats based on it. Envelopes of windows are cached
+# as 'float32' '.npy' files, so beat tracking with different parameters (like
+# `start_bpm`) doesn't need audio at all. Cache file names contain hash of audio
+# file content and parameters used to compute envelope.
+def compute_file_hash(path, chunk_size=2**20):
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()[:16]
+
+
+def get_cache_prefix(cache_dir, path):
+    if cache_dir is None:
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+    params = f"sr{sample_rate}_hop{hop_length}_win{window_length}-{window_overlap}"
+    return os.path.join(cache_dir, f"{compute_file_hash(path)}_{params}")
+
+
+def load_envelope(cache_prefix, i):
+    if cache_prefix is None or not os.path.exists(f"{cache_prefix}_{i:04d}.npy"):
+        return None
+    return np.load(f"{cache_prefix}_{i:04d}.npy", mmap_mode="r")
+
+
+def save_envelope(cache_prefix, i, envelope):
+    if cache_prefix is None:
+        return
+    # Write to temporary file first, so that interrupted run doesn't leave
+    # incomplete cache file
+    path = f"{cache_prefix}_{i:04d}.npy"
+    with open(f"{path}.tmp", "wb") as f:
+        np.save(f, envelope)
+    os.replace(f"{path}.tmp", path)
+
+
+def compute_envelope(audio, native_sr):
+    # `audio` is array of window samples with shape (n_samples, n_channels)
+    audio = librosa.resample(
+        audio.mean(axis=1), orig_sr=native_sr, target_sr=sample_rate
+    )
+    envelope = librosa.onset.onset_strength(
+        y=audio, sr=sample_rate, hop_length=hop_length
+    )
+    return envelope.astype(np.float32)
+
+
+def detect_beats(envelope, start_bpm):
     # More accurate bounce detection can be done with "beat detection", as ball
     # bounces have distinctive sounds and Dan hardly speaks during whole video.
-    # Here `tempo` is average tempo of beats and `beats` is detected timestamps of
-    # "beats" which here is ball bounces.
-    print(f"  Detecting beats")
+    # Here `tempo` is average tempo of beats and `beats` is detected timestamps
+    # of "beats" which here is ball bounces.
     tempo, beats = librosa.beat.beat_track(
-        audio, sample_rate, start_bpm=160, units="time"
+        onset_envelope=envelope,
+        sr=sample_rate,
+        hop_length=hop_length,
+        start_bpm=start_bpm,
+        units="time",
     )
-    ## Shift beat timing by "global" timestamp of audio start
-    beats = beats + split_period * i
+    return beats
+
+
+def get_window_core(i, n_windows):
+    # Time interval (in seconds) from which beats of `i`-th window are kept
+    step = window_length - window_overlap
+    lower = i * step + 0.5 * window_overlap if i > 0 else -math.inf
+    upper = (i + 1) * step + 0.5 * window_overlap if i < n_windows - 1 else math.inf
+    return lower, upper
+
+
+def count_windows(n_frames, native_sr):
+    blocksize = window_length * native_sr
+    step = (window_length - window_overlap) * native_sr
+    return max(1, math.ceil(max(n_frames - blocksize, 0) / step) + 1)
+
+
+def read_window(path, i, native_sr):
+    # Read only samples of `i`-th window, so it can be processed independently
+    step = (window_length - window_overlap) * native_sr
+    audio, _ = sf.read(
+        path,
+        start=i * step,
+        stop=i * step + window_length * native_sr,
+        dtype="float32",
+        always_2d=True,
+    )
+    return audio
+
+
+def process_window(path, i, n_windows, native_sr, start_bpm, cache_prefix, audio=None):
+    # Audio of window is read (if not supplied) only if its envelope is not
+    # cached
+    envelope = load_envelope(cache_prefix, i)
+    if envelope is None:
+        if audio is None:
+            audio = read_window(path, i, native_sr)
+        envelope = compute_envelope(audio, native_sr)
+        save_envelope(cache_prefix, i, envelope)
+
+    step = window_length - window_overlap
+    beats = detect_beats(envelope, start_bpm) + i * step
+
+    lower, upper = get_window_core(i, n_windows)
+    return beats[(lower <= beats) & (beats < upper)]
+
+
+def stream_beats(path, start_bpm=default_start_bpm, cache_prefix=None):
+    info = sf.info(path)
+    native_sr = info.samplerate
+    n_windows = count_windows(info.frames, native_sr)
+
+    # Reading is done block by block, so only one window is in memory. There
+    # is no reading if all envelopes are cached.
+    windows = range(n_windows)
+    if all(load_envelope(cache_prefix, i) is not None for i in windows):
+        blocks = [None] * n_windows
+    else:
+        blocks = sf.blocks(
+            path,
+            blocksize=window_length * native_sr,
+            overlap=window_overlap * native_sr,
+            dtype="float32",
+            always_2d=True,
+        )
+
+    res = []
+    for i, block in zip(windows, blocks):
+        print(f"  Detecting beats in window {i + 1}/{n_windows}")
+        args = (path, i, n_windows, native_sr, start_bpm, cache_prefix, block)
+        res.append(process_window(*args))
+    # Own parts of windows are ordered and don't intersect, so concatenation
+    # is already sorted and doesn't need merging
+    return np.concatenate(res)
+
+
+def parallel_beats(path, workers, start_bpm=default_start_bpm, cache_prefix=None):
+    # Windows are processed concurrently in separate processes. Every process
+    # holds only one window in memory, so `workers` also limits RAM usage.
+    info = sf.info(path)
+    native_sr = info.samplerate
+    n_windows = count_windows(info.frames, native_sr)
+
+    # Own parts of windows don't intersect and are ordered, so concatenating
+    # results in order of windows (as returned by `map()`) gives sorted beats
+    # regardless of order in which windows are finished
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        res = executor.map(
+            process_window,
+            [path] * n_windows,
+            range(n_windows),
+            [n_windows] * n_windows,
+            [native_sr] * n_windows,
+            [start_bpm] * n_windows,
+            [cache_prefix] * n_windows,
+        )
+        return np.concatenate(list(res))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detect ball bounces in audio")
+    parser.add_argument(
+        "--audio",
+        default="ttd-world-record_audio.mp3",
+        help="Path to audio file with whole record",
+    )
+    parser.add_argument(
+        "--output",
+        default="ttd-world-record_beats.csv",
+        help="Path to output file: binary if it has '.npz' extension, CSV otherwise",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes analyzing windows concurrently (each holds "
+        "one window in memory). With 1 audio is streamed in a single process.",
+    )
+    parser.add_argument(
+        "--start-bpm",
+        type=float,
+        default=default_start_bpm,
+        help="Prior estimate of tempo for beat tracking",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=".beats-cache",
+        help="Directory with cached onset strength envelopes",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Don't read or write cache"
+    )
+    args = parser.parse_args()
+
+    print(f"Processing {args.audio}")
+    cache_prefix = get_cache_prefix(
+        None if args.no_cache else args.cache_dir, args.audio
+    )
+    if args.workers > 1:
+        beats = parallel_beats(args.audio, args.workers, args.start_bpm, cache_prefix)
+    else:
+        beats = stream_beats(args.audio, args.start_bpm, cache_prefix)
+
     ## Round to milliseconds
     beats = np.round(beats, decimals=3)
-    ## Save beats
-    audio_name = os.path.splitext(file)[0]
-    beats_file = f"{audio_name}_beats.csv"
-    np.savetxt(beats_file, beats, fmt="%.3f", delimiter=",")
-
-# Produce a single beats array
-beats_files = glob.glob("*audio[0-9][0-9][0-9]_beats.csv")
-beats = np.concatenate([np.loadtxt(f, delimiter=",") for f in beats_files])
-beats = np.sort(beats)
-
-# Filter only those beats that were detected during actual ball bouncing, which
-# starts at 74th second (00:01:14) of 'ttd-world-record_audio.mp3' file and
-# ends at 19215th (05:20:15)
-beats = beats[(beats >= 74) & (beats <= 19215)]
-
-# Save beats
-np.savetxt("ttd-world-record_beats.csv", beats, fmt="%.3f", delimiter=",")
+
+    # Filter only those beats that were detected during actual ball bouncing,
+    # which starts at 74th second (00:01:14) of 'ttd-world-record_audio.mp3' file
+    # and ends at 19215th (05:20:15)
+    beats = beats[(beats >= 74) & (beats <= 19215)]
+
+    # Save beats
+    if args.output.endswith(".npz"):
+        save_beats(args.output, beats)
+    else:
+        export_csv(args.output, beats)
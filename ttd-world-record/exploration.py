@@ -1,34 +1,10 @@
 import numpy as np
-from scipy.ndimage.filters import uniform_filter1d
 import matplotlib.pyplot as plt
 
-beats = np.loadtxt("ttd-world-record_beats.csv", delimiter=",")
-
-# How tempo changed over time
-def compute_instant_tempo(beats, n=5):
-    """Instantaneous tempo of beats
-
-    Computation is done by inversing "local" period in seconds and converting
-    into standard "beats per minute". "Local" period is computed by averaging
-    two differences between three consecutive beat timestamps. For first and
-    last beats first and last differences are taken.
-    """
-    beat_diff = np.diff(beats)
-    local_period = uniform_filter1d(beat_diff, size=n)
-    # local_period = 0.5 * (beat_diff[:-1] + beat_diff[1:])
-    instant_tempo = 60 / local_period
-    start_tempo = 60 / beat_diff[0]
-
-    return np.concatenate([[start_tempo], instant_tempo])
-
-
-def sec_to_time(x):
-    hours = x // 3600
-    mins = (x - 3600 * hours) // 60
-    secs = x - 3600 * hours - 60 * mins
-
-    return list(zip(hours, mins, secs))
+from beats_format import load_beats
+from tempo import TempoTracker, compute_instant_tempo, format_time
 
+beats = load_beats("ttd-world-record_beats.csv")
 
 print(f"Total number of detected bounces: {len(beats)}")
 
@@ -36,9 +12,18 @@ duration_minutes = (beats[-1] - beats[0]) / 60
 avg_bpm = len(beats) / duration_minutes
 print(f"Average number of bounces per minute: {avg_bpm}")
 
+# How tempo changed over time
 plt.plot(beats, compute_instant_tempo(beats, n=61))
 plt.show()
 
+# Same can be done online (for example, while beats are being detected) by
+# supplying beats in batches. This also detects gaps between beats.
+tempo_tracker = TempoTracker(n=60)
+for batch in np.array_split(beats, 100):
+    tempo_tracker.update(batch)
+for start, end in tempo_tracker.gaps:
+    print(f"Gap from {format_time(start)} to {format_time(end)}")
+
 # There is some missing footage. Total time of record based on footage is
 # 5h19m1s (from 00:01:14 to 05:20:15 video timestamps). However, tablet shows
 # total time of 5h21m4s (from 00:00:03 to 05:21:07 at corresponding video
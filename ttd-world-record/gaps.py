@@ -0,0 +1,167 @@
+import argparse
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.ndimage import median_filter
+
+from beats_format import load_beats
+from tempo import compute_instant_tempo, format_time
+
+# Scale of median absolute deviation to make it consistent estimate of standard
+# deviation for normally distributed data
+mad_scale = 1.4826
+
+
+def window_stats(x, ind, window=61):
+    """Median and median absolute deviation of windows centered at `ind`
+
+    Edges of `x` are padded with reflection. Only windows at `ind` are
+    computed, which takes O(len(ind) * window) time.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    half = window // 2
+    padded = np.pad(x, (half, window - 1 - half), mode="reflect")
+    windows = sliding_window_view(padded, window)[ind]
+    median = np.median(windows, axis=1)
+    mad = np.median(np.abs(windows - median[:, np.newaxis]), axis=1)
+    return median, mad
+
+
+def detect_gaps(beats, window=61, threshold=5, min_ratio=1.5, z=3):
+    """Detect gaps between beats with missed beats
+
+    Interval between beats is a gap if it is at least `min_ratio` times longer
+    than local median interval and bigger than it by more than `threshold`
+    local robust standard deviations (scaled median absolute deviation).
+    Number of missed beats in a gap is estimated with local median interval as
+    period. Its error bound is `z` standard deviations of the number of beats
+    that fit into the gap, assuming independent jitter of intervals and
+    uncertainty of period estimate.
+
+    Candidate intervals are the ones at least `min_ratio` times longer than
+    local median interval (computed with a rolling median filter in
+    O(n log window) time for n beats). Unlike rolling mean, it isn't inflated
+    by a long gap, so gaps close to each other are all detected. Median
+    absolute deviation is computed only for candidates.
+
+    Returns dictionary of arrays with one element per gap (empty if there
+    are fewer than two beats).
+    """
+    beats = np.asarray(beats, dtype=np.float64)
+    if len(beats) < 2:
+        empty = np.empty(0)
+        return {
+            "start": empty,
+            "end": empty,
+            "period": empty,
+            "n_missed": empty.astype(int),
+            "error": empty,
+        }
+
+    intervals = np.diff(beats)
+    # "mirror" mode matches "reflect" padding of `window_stats()`
+    local_median = median_filter(intervals, size=window, mode="mirror")
+    ind = np.flatnonzero(intervals >= min_ratio * local_median)
+
+    median, mad = window_stats(intervals, ind, window=window)
+    sd = mad_scale * mad
+    duration = intervals[ind]
+    is_gap = (duration >= min_ratio * median) & (duration - median > threshold * sd)
+    ind, period, sd, duration = (
+        ind[is_gap],
+        median[is_gap],
+        sd[is_gap],
+        duration[is_gap],
+    )
+
+    n_missed = np.round(duration / period) - 1
+    error = z * _count_sd(duration, period, sd, window)
+    return {
+        "start": beats[ind],
+        "end": beats[ind + 1],
+        "period": period,
+        "n_missed": n_missed.astype(int),
+        "error": error,
+    }
+
+
+def extrapolate_missing(beats, at, duration, window=61, z=3):
+    """Estimate number of beats inside missing footage
+
+    Missing footage of `duration` seconds at `at` seconds (both can be arrays)
+    is filled with beats at local tempo (from `compute_instant_tempo()`) of
+    nearest detected beat. Error bound is computed as in `detect_gaps()`.
+
+    Returns number of beats and its error bound.
+    """
+    beats = np.asarray(beats, dtype=np.float64)
+    at, duration = np.asarray(at, dtype=np.float64), np.asarray(duration)
+    ind = np.clip(np.searchsorted(beats, at), 0, len(beats) - 1)
+    period = 60 / compute_instant_tempo(beats, n=window)[ind]
+
+    intervals = np.diff(beats)
+    _, mad = window_stats(intervals, np.clip(ind, 0, len(intervals) - 1), window)
+    sd = mad_scale * mad
+
+    return duration / period, z * _count_sd(duration, period, sd, window)
+
+
+def correct_total(beats, footage_at=(), footage_duration=(), window=61):
+    """Estimate total number of beats accounting for gaps
+
+    Missed beats inside detected gaps between beats and inside supplied
+    missing footage are added to the number of detected beats. Errors of all
+    estimates are assumed independent.
+
+    Returns corrected total and its error bound.
+    """
+    gaps = detect_gaps(beats, window=window)
+    n_footage, error_footage = extrapolate_missing(
+        beats, footage_at, footage_duration, window=window
+    )
+    total = len(beats) + gaps["n_missed"].sum() + n_footage.sum()
+    error = np.sqrt(np.sum(gaps["error"] ** 2) + np.sum(error_footage**2))
+    return total, error
+
+
+def _count_sd(duration, period, sd, window):
+    # Standard deviation of number of periods inside `duration`: accumulated
+    # jitter of intervals plus error of period estimated from `window` ones
+    n = duration / period
+    rel_sd = sd / period
+    return np.sqrt(n * rel_sd**2 + (n * rel_sd) ** 2 / window)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detect gaps in beats")
+    parser.add_argument(
+        "--beats",
+        default="ttd-world-record_beats.csv",
+        help="Path to beats file ('.npz' binary or CSV)",
+    )
+    parser.add_argument(
+        "--footage-gap",
+        type=float,
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("AT", "DURATION"),
+        help="Time and duration (in seconds) of known missing footage",
+    )
+    args = parser.parse_args()
+
+    beats = load_beats(args.beats)
+    gaps = detect_gaps(beats)
+    print(f"Detected {len(gaps['start'])} gaps between beats:")
+    for start, end, n_missed, error in zip(
+        format_time(gaps["start"], decimals=3),
+        format_time(gaps["end"], decimals=3),
+        gaps["n_missed"],
+        gaps["error"],
+    ):
+        print(f"  {start} - {end}: {n_missed} missed beats (+-{error:.1f})")
+
+    footage_at, footage_duration = np.array(args.footage_gap).reshape(-1, 2).T
+    total, error = correct_total(beats, footage_at, footage_duration)
+    print(f"Detected beats: {len(beats)}")
+    print(f"Corrected total: {total:.0f} (+-{error:.0f})")
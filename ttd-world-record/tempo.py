@@ -0,0 +1,112 @@
+import warnings
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.ndimage import uniform_filter1d
+
+
+class TempoTracker:
+    """Online tempo analysis of beats
+
+    Beat timestamps (in seconds) are supplied in order one at a time or in
+    batches of any size with `update()`. Only the last `n + 1` timestamps are
+    stored between updates, so it can be used while beats are being detected.
+
+    For every beat there is computed:
+    - Rolling tempo (in beats per minute) as inverse of average of last `n`
+      intervals between beats (including the one ending at this beat).
+    - Whether interval ending at this beat is a gap: it is longer than
+      `gap_factor` times median of previous `n` intervals. Gaps in footage (due
+      to video jumps) are detected this way.
+
+    Attributes:
+    - `n_beats` : Number of beats supplied so far.
+    - `gaps` : List of pairs of timestamps of beats surrounding detected gaps.
+    """
+
+    def __init__(self, n=60, gap_factor=3):
+        self.n = n
+        self.gap_factor = gap_factor
+        self.n_beats = 0
+        self.gaps = []
+        self._recent = np.empty(0)
+
+    def update(self, beats):
+        """Process new beats and return their rolling tempo
+
+        First beat ever supplied has `nan` tempo.
+        """
+        beats = np.atleast_1d(np.asarray(beats, dtype=np.float64))
+        n, n_recent = self.n, len(self._recent)
+        t = np.concatenate([self._recent, beats])
+
+        # Indices of new beats inside `t` and of beats `n` intervals before
+        ind = np.arange(n_recent, len(t))
+        ind_start = np.maximum(ind - n, 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            tempo = 60 * (ind - ind_start) / (t[ind] - t[ind_start])
+        tempo[ind == ind_start] = np.nan
+
+        # Compare every new interval with median of previous `n` intervals
+        intervals = np.diff(t)
+        padded = np.concatenate([np.full(n, np.nan), intervals])
+        ## Interval ending at beat with index `i` has index `i - 1`
+        new = ind[ind > 0] - 1
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            median = np.nanmedian(sliding_window_view(padded, n)[new], axis=1)
+        is_gap = intervals[new] > self.gap_factor * median
+        self.gaps.extend(zip(t[new[is_gap]].tolist(), t[new[is_gap] + 1].tolist()))
+
+        self.n_beats += len(beats)
+        self._recent = t[-(n + 1) :]
+        return tempo
+
+    @property
+    def gap_time(self):
+        """Total time inside detected gaps"""
+        return sum(end - start for start, end in self.gaps)
+
+
+def compute_instant_tempo(beats, n=5):
+    """Instantaneous tempo of beats
+
+    Computation is done by inversing "local" period in seconds and converting
+    into standard "beats per minute". "Local" period is computed by averaging
+    two differences between three consecutive beat timestamps. For first and
+    last beats first and last differences are taken.
+    """
+    beat_diff = np.diff(beats)
+    local_period = uniform_filter1d(beat_diff, size=n)
+    # local_period = 0.5 * (beat_diff[:-1] + beat_diff[1:])
+    instant_tempo = 60 / local_period
+    start_tempo = 60 / beat_diff[0]
+
+    return np.concatenate([[start_tempo], instant_tempo])
+
+
+def sec_to_time(x):
+    """Split seconds into hours, minutes, and seconds
+
+    Returns array with columns of hours, minutes, and seconds.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    hours, rest = np.divmod(x, 3600)
+    mins, secs = np.divmod(rest, 60)
+    return np.stack([hours, mins, secs], axis=-1)
+
+
+def format_time(x, decimals=0):
+    """Format seconds as 'HH:MM:SS' strings"""
+    # Round beforehand, so that seconds don't round up to 60
+    hours, mins, secs = np.moveaxis(sec_to_time(np.round(x, decimals)), -1, 0)
+    secs_width = 2 + (decimals + 1 if decimals > 0 else 0)
+    return np.char.add(
+        np.char.add(
+            np.char.zfill(hours.astype(int).astype(str), 2),
+            np.char.add(":", np.char.zfill(mins.astype(int).astype(str), 2)),
+        ),
+        np.char.add(
+            ":", np.char.zfill(np.char.mod(f"%.{decimals}f", secs), secs_width)
+        ),
+    )